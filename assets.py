@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+Assets derived from the pictures of the examples: thumbnails, previews and
+pyramids of tiles, in JPEG and WebP. They are generated on demand and stored
+on disk under the hash of the content of their picture, so that they are
+shared by identical pictures and never served stale.
+Generate all the assets of the examples ahead of time with:
+    python assets.py data
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from math import ceil, log2
+from pathlib import Path
+
+import PIL.Image
+
+# The formats of the assets: their PIL format and their media type.
+FORMATS = {
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+ASSET = re.compile(r"^(?:(thumbnail|preview)|tiles/(\d+)/(\d+)_(\d+))\.(jpg|webp)$")
+
+
+class AssetStore:
+    """
+    The assets of the pictures registered (see register), in 'directory':
+     - "thumbnail.<format>": the picture within thumbnail_size x thumbnail_size
+     - "preview.<format>": the picture within preview_size x preview_size
+     - "tiles/<level>/<column>_<row>.<format>": the tiles (tile_size x tile_size
+       at most) of the pyramid of the picture. The picture fits in one tile at
+       level 0, and its size doubles at each level up to its full size.
+    An asset is stored in directory/<hash of the picture>/<asset>.
+    """
+
+    def __init__(self, directory=".assets", thumbnail_size=256, preview_size=1600, tile_size=256, quality=85):
+        self.directory = Path(directory)
+        self.thumbnail_size = thumbnail_size
+        self.preview_size = preview_size
+        self.tile_size = tile_size
+        self.quality = quality
+        # The pictures registered, by hash, and their hash, by (path, mtime, size).
+        self.sources = {}
+        self.hashes = {}
+        # The assets are generated one at a time, once.
+        self.lock = threading.Lock()
+
+    def register(self, path):
+        """Register the picture at path, and return its hash."""
+        path = Path(path)
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        if key not in self.hashes:
+            self.hashes[key] = hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+        self.sources[self.hashes[key]] = path
+        return self.hashes[key]
+
+    def levels(self, size):
+        """Return the number of levels of the pyramid of a picture of size (width, height)."""
+        return max(0, ceil(log2(max(size) / self.tile_size))) + 1
+
+    def manifest(self, path, size, prefix="", format="webp"):
+        """
+        Register the picture at path, of size (width, height), and return the
+        urls (prefix + hash + asset) of its assets in format: its 'thumbnail',
+        its 'preview', and the template of its 'tiles', with the 'tile_size'
+        and the number of 'levels'.
+        """
+        base = "{}{}/".format(prefix, self.register(path))
+        return {
+            "thumbnail": "{}thumbnail.{}".format(base, format),
+            "preview": "{}preview.{}".format(base, format),
+            "tiles": "{}tiles/{{level}}/{{column}}_{{row}}.{}".format(base, format),
+            "tile_size": self.tile_size,
+            "levels": self.levels(size),
+        }
+
+    def get(self, hash, asset):
+        """
+        Return the path of the file of asset for the picture of hash, and its
+        media type. The asset is generated if it doesn't exist yet.
+        Raise a KeyError if the asset or the picture are unknown.
+        """
+        match = ASSET.match(asset)
+        if match is None or not re.fullmatch(r"[0-9a-f]+", hash):
+            raise KeyError(asset)
+        name, level, column, row, format = match.groups()
+        path = self.directory / hash / asset
+        if path.exists():
+            return path, FORMATS[format][1]
+        if hash not in self.sources:
+            raise KeyError(hash)
+        with self.lock, PIL.Image.open(self.sources[hash]) as img:
+            if name is None and not self._has_tile(img.size, int(level), int(column), int(row)):
+                raise KeyError(asset)
+            if not path.exists():
+                img = img.convert("RGB")
+                if name is not None:
+                    self._generate_resized(img, hash, name, format)
+                else:
+                    self._generate_level(img, hash, int(level), format)
+        return path, FORMATS[format][1]
+
+    def prepare(self, path):
+        """Generate all the assets of the picture at path."""
+        hash = self.register(path)
+        with PIL.Image.open(path) as img:
+            img = img.convert("RGB")
+            for format in FORMATS:
+                for name in ("thumbnail", "preview"):
+                    self._generate_resized(img, hash, name, format)
+                for level in range(self.levels(img.size)):
+                    self._generate_level(img, hash, level, format)
+        return hash
+
+    def _generate_resized(self, img, hash, name, format):
+        """Generate the thumbnail or the preview of img."""
+        size = self.thumbnail_size if name == "thumbnail" else self.preview_size
+        resized = img.copy()
+        resized.thumbnail((size, size), PIL.Image.LANCZOS)
+        self._save(resized, self.directory / hash / "{}.{}".format(name, format), format)
+
+    def _level_size(self, size, level):
+        """Return the size (width, height) of a picture of size at level."""
+        scale = 2 ** (level - self.levels(size) + 1)
+        return tuple(max(1, round(x * scale)) for x in size)
+
+    def _has_tile(self, size, level, column, row):
+        """Return True if a picture of size has the tile (column, row) at level."""
+        if level >= self.levels(size):
+            return False
+        width, height = self._level_size(size, level)
+        return column * self.tile_size < width and row * self.tile_size < height
+
+    def _generate_level(self, img, hash, level, format):
+        """Generate all the tiles of img at level."""
+        width, height = self._level_size(img.size, level)
+        scaled = img if (width, height) == img.size else img.resize((width, height), PIL.Image.LANCZOS)
+        tile = self.tile_size
+        for column in range(ceil(width / tile)):
+            for row in range(ceil(height / tile)):
+                box = (column * tile, row * tile, min(width, (column + 1) * tile), min(height, (row + 1) * tile))
+                path = self.directory / hash / "tiles" / str(level) / "{}_{}.{}".format(column, row, format)
+                self._save(scaled.crop(box), path, format)
+
+    def _save(self, img, path, format):
+        """Save img at path, atomically so that a partial file is never served."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, FORMATS[format][0], quality=self.quality)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the assets of the pictures of the examples.")
+    parser.add_argument("data", nargs="?", default="data", help="the directory of the examples")
+    parser.add_argument("--directory", default=".assets", help="the directory of the assets")
+    args = parser.parse_args()
+    store = AssetStore(args.directory)
+    for info in sorted(Path(args.data).glob("*/info.json")):
+        with info.open() as f:
+            picture = info.parent / json.load(f)["picture"]
+        print("{}: {}".format(picture, store.prepare(picture)))
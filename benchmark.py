@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the building blocks of the optimizer.
+"""
+
+import argparse
+import json
+import random
+import time
+from math import cos, pi, sin
+from pathlib import Path
+
+import optimizer
+from converter import Converter
+from profiling import EvaluationCounter
+from tools import photographer_area, photographer_area_bruteforce
+
+
+def random_summits(n, seed=0):
+    """
+    Return n random summits, in the order they appear on a picture taken from (0, 0).
+    """
+    rand = random.Random(seed)
+    angles = sorted((rand.uniform(pi / 6, 5 * pi / 6) for _ in range(n)), reverse=True)
+    distances = [rand.uniform(1000, 10000) for _ in range(n)]
+    return [(d * cos(a), d * sin(a)) for (a, d) in zip(angles, distances)]
+
+
+def timeit(fun, *args, repeat=3, **kwargs):
+    """Return the best time (in seconds) of 'repeat' calls of fun."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_area(sizes, max_bruteforce, repeat):
+    """
+    Compare photographer_area to photographer_area_bruteforce for several numbers of summits.
+    """
+    print("%8s %15s %15s %8s" % ("summits", "bruteforce (s)", "half-planes (s)", "speedup"))
+    for n in sizes:
+        summits = random_summits(n)
+        fast = timeit(photographer_area, summits, repeat=repeat)
+        if n <= max_bruteforce:
+            slow = timeit(photographer_area_bruteforce, summits, repeat=repeat)
+            print("%8d %15.4f %15.4f %8.1f" % (n, slow, fast, slow / fast))
+        else:
+            print("%8d %15s %15.4f %8s" % (n, "-", fast, "-"))
+
+
+def examples():
+    """Generate the (name, summits, projections) of the examples in data (in UTM coordinates)."""
+    for infojson in sorted(Path("data").glob("*/info.json")):
+        with infojson.open() as infofile:
+            info = json.load(infofile)
+        conv = Converter(*info["latlngs"][0])
+        summits = [tuple(p) for p in conv.from_latlng_batch(info["latlngs"]).tolist()]
+        yield infojson.parent.name, summits, [p[0] for p in info["projections"]]
+
+
+def benchmark_methods(configurations):
+    """
+    Compare the evaluations of the error needed by the methods of find_photographer on the examples.
+    """
+    print("%-22s %-13s %-10s %9s %12s %9s %9s" % (
+        "example", "method", "engine", "positions", "evaluations", "error", "time (s)"))
+    for name, summits, projections in examples():
+        for method, engine in configurations:
+            start = time.perf_counter()
+            try:
+                with EvaluationCounter() as counter:
+                    result = optimizer.find_photographer(summits, projections, method=method, engine=engine,
+                                                        record_path=True, path_maxlen=10 ** 6)
+            except RuntimeError:
+                print("%-22s %-13s %-10s %9s" % (name, method, engine, "failed"))
+                continue
+            print("%-22s %-13s %-10s %9d %12d %9.2e %9.3f" % (
+                name, method, engine, len(result.path), counter.count, result.error,
+                time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    area = subparsers.add_parser("area", help=benchmark_area.__doc__.strip())
+    area.add_argument("--sizes", type=int, nargs="+", default=[3, 5, 10, 15, 20, 30, 50, 100],
+                      help="numbers of summits")
+    area.add_argument("--max-bruteforce", type=int, default=20,
+                      help="largest number of summits for the (slow) reference implementation")
+    area.add_argument("--repeat", type=int, default=3, help="calls timed for each size")
+    methods = subparsers.add_parser("methods", help=benchmark_methods.__doc__.strip())
+    methods.add_argument("--configurations", nargs="+", default=["nested:slsqp", "nested:vectorized", "joint:-", "least_squares:-"],
+                         help="method:engine of find_photographer to compare")
+    args = parser.parse_args()
+    if args.benchmark == "area":
+        benchmark_area(args.sizes, args.max_bruteforce, args.repeat)
+    elif args.benchmark == "methods":
+        benchmark_methods([c.split(":") for c in args.configurations])
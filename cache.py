@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Caches of the results of the optimizer, keyed on its (normalized) inputs.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+class LocateCache:
+    """
+    A LRU cache, bounded in size, whose entries expire after 'ttl' seconds.
+    The latlngs and projections are rounded to 'digits' and 'projection_digits'
+    decimals to compute the keys, so that nearly identical inputs share the
+    same entry.
+    """
+
+    def __init__(self, size=1024, ttl=3600, digits=6, projection_digits=1):
+        self.size = size
+        self.ttl = ttl
+        self.digits = digits
+        self.projection_digits = projection_digits
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def key(self, latlngs, projections, **options):
+        """Return the key of the inputs of the optimizer."""
+        canonical = json.dumps([
+            [[round(x, self.digits) for x in p] for p in latlngs],
+            [round(p, self.projection_digits) for p in projections],
+            options,
+        ], sort_keys=True)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the value of key, None if it is missing or expired."""
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Save value (that must be serializable in json) for key."""
+        if self.size > 0:
+            self._set(key, value)
+        return value
+
+    def stats(self):
+        """Return the counters of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self),
+            "size": self.size,
+            "ttl": self.ttl,
+        }
+
+    def close(self):
+        """Release the resources of the cache."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _get(self, key):
+        if key not in self.entries:
+            return None
+        expires, value = self.entries[key]
+        if expires < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class SqliteLocateCache(LocateCache):
+    """
+    A LocateCache saved in a sqlite database, so that it survives restarts.
+    """
+
+    def __init__(self, path, size=1024, ttl=3600, digits=6, projection_digits=1):
+        super().__init__(size, ttl, digits, projection_digits)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)"
+        )
+        self.db.commit()
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _get(self, key):
+        row = self.db.execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        now = time.time()
+        if expires < now:
+            self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.db.commit()
+            return None
+        self.db.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        return json.loads(value)
+
+    def _set(self, key, value):
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl, now),
+        )
+        self.db.execute(
+            "DELETE FROM cache WHERE key NOT IN "
+            "(SELECT key FROM cache ORDER BY used DESC LIMIT ?)",
+            (self.size,),
+        )
+        self.db.commit()
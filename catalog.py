@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+In-memory catalogs of the files served by the server, rendered once and
+reloaded when the files change (on their modification time).
+"""
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+import PIL.Image
+
+
+def _etag(content):
+    """Return the (strong) ETag of content (bytes)."""
+    return '"{}"'.format(hashlib.sha1(content).hexdigest())
+
+
+def _mtime(path):
+    """Return the modification time of path, None if it doesn't exist."""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class RenderedFile:
+    """
+    The content of the file 'path' rendered by 'render' (a function of the
+    text of the file returning a string), with its ETag.
+    It is rendered again when the file changes.
+    """
+
+    def __init__(self, path, render=lambda text: text):
+        self.path = Path(path)
+        self.render = render
+        self.mtime = None
+        self.content = None
+        self.etag = None
+
+    def get(self):
+        """Return the rendered content (bytes) and its ETag."""
+        mtime = _mtime(self.path)
+        if self.content is None or mtime != self.mtime:
+            self.content = self.render(self.path.read_text()).encode()
+            self.etag = _etag(self.content)
+            self.mtime = mtime
+        return self.content, self.etag
+
+
+class ExampleCatalog:
+    """
+    The examples of 'directory': the sub directories with an info.json file.
+    The list of examples and their data (the content of info.json with the
+    path and the size of the picture) are kept in memory, serialized in json
+    with their ETags. They are loaded again when the directory, the info.json
+    file or the picture of an example change.
+    With an AssetStore, the data also has the urls of the 'assets' of the
+    picture (see AssetStore.manifest), prefixed with assets_prefix.
+    The catalog may be used from several threads.
+    """
+
+    def __init__(self, directory="data", assets=None, assets_prefix="assets/"):
+        self.directory = Path(directory)
+        self.assets = assets
+        self.assets_prefix = assets_prefix
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Drop the catalog, it is loaded again on the next access."""
+        self.mtime = None
+        self.names = None
+        self.listing = None
+        self.entries = {}
+
+    def _names(self):
+        """Return the set of the names of the examples, listed again if the directory changed."""
+        mtime = _mtime(self.directory)
+        if self.names is None or mtime != self.mtime:
+            self.names = {p.name for p in self.directory.iterdir() if p.joinpath("info.json").exists()}
+            content = json.dumps(sorted(self.names)).encode()
+            self.listing = (content, _etag(content))
+            self.mtime = mtime
+            # Forget the examples that were removed
+            self.entries = {name: entry for name, entry in self.entries.items() if name in self.names}
+        return self.names
+
+    def list(self):
+        """Return the list of the names of the examples, in json, with its ETag."""
+        with self.lock:
+            self._names()
+            return self.listing
+
+    def get(self, name):
+        """
+        Return the data of the example 'name', in json, with its ETag.
+        Raise a KeyError if there is no such example.
+        """
+        with self.lock:
+            return self._get(name)
+
+    def load(self):
+        """Load the data of all the examples (e.g. at startup)."""
+        for name in json.loads(self.list()[0]):
+            self.get(name)
+
+    def _get(self, name):
+        """Return the data of the example 'name', see get."""
+        if name not in self._names():
+            raise KeyError(name)
+        dir = self.directory / name
+        entry = self.entries.get(name)
+        # The entry is up to date if its info.json and its picture didn't change.
+        if entry is not None and all(_mtime(path) == mtime for path, mtime in entry["mtimes"]):
+            return entry["content"], entry["etag"]
+        with dir.joinpath("info.json").open() as f:
+            data = json.load(f)
+        picture = dir / data["picture"]
+        with PIL.Image.open(picture) as img:
+            data["picture_size"] = img.size
+        if self.assets is not None:
+            data["assets"] = self.assets.manifest(picture, data["picture_size"], self.assets_prefix)
+        data["picture"] = str(picture)
+        content = json.dumps(data).encode()
+        self.entries[name] = {
+            "mtimes": [(path, _mtime(path)) for path in (dir / "info.json", picture)],
+            "content": content,
+            "etag": _etag(content),
+        }
+        return content, self.entries[name]["etag"]
@@ -2,22 +2,107 @@
 
 """
 Converter class to ensure a consistent conversion between lat&lng and UTM.
-It ensures the same UTM zone is used.
+It ensures the same UTM zone is used (or the same plane tangent to the earth).
 """
 
+from math import cos, radians, sin
+
+import numpy as np
 import utm
 
+from profiling import profiled
+
+# WGS84 ellipsoid
+A = 6378137.0
+E2 = 6.69437999014e-3
+
+
 class Converter:
+    """
+    Convert lat&lng to (x, y) coordinates in meters, and back, with one of the modes:
+     - "utm": the UTM coordinates in the zone of the reference point.
+     - "local": the (east, north) coordinates on the plane tangent to the earth
+       at the reference point. The projection is precomputed, without any zone
+       math, and its distortion is below 1e-5 within 20 km of the reference point.
+    The batch methods convert arrays (N, 2) of points at once.
+    """
 
-    def __init__(self, lat, lng):
+    def __init__(self, lat, lng, mode="utm"):
+        if mode not in ("utm", "local"):
+            raise RuntimeError("Unknown mode: {}".format(mode))
+        self.mode = mode
         _, _, self.zone_number, self.zone_letter = utm.from_latlon(
             lat, lng
         )
+        # The origin of the tangent plane (ECEF) and its east, north and up axes.
+        self.origin = _ecef(np.radians(lat), np.radians(lng))
+        phi, lam = radians(lat), radians(lng)
+        self.axes = np.array([
+            (-sin(lam), cos(lam), 0),
+            (-sin(phi) * cos(lam), -sin(phi) * sin(lam), cos(phi)),
+            (cos(phi) * cos(lam), cos(phi) * sin(lam), sin(phi)),
+        ])
 
+    @profiled("conversion")
     def from_latlng(self, lat, lng):
+        if self.mode == "local":
+            return tuple(float(v) for v in self.from_latlng_batch([(lat, lng)])[0])
         return utm.from_latlon(lat, lng, self.zone_number, self.zone_letter)[:2]
 
+    @profiled("conversion")
     def to_latlng(self, easting, northing, strict=True):
+        if self.mode == "local":
+            return tuple(float(v) for v in self.to_latlng_batch([(easting, northing)], strict)[0])
         return utm.to_latlon(
             easting, northing, self.zone_number, self.zone_letter, strict=strict
         )
+
+    @profiled("conversion")
+    def from_latlng_batch(self, latlngs):
+        """Convert an array (N, 2) of lat&lng to an array (N, 2) of (x, y)."""
+        latlngs = np.asarray(latlngs, dtype=float).reshape(-1, 2)
+        if self.mode == "local":
+            points = _ecef(np.radians(latlngs[:, 0]), np.radians(latlngs[:, 1])) - self.origin
+            return points @ self.axes[:2].T
+        x, y, _, _ = utm.from_latlon(latlngs[:, 0], latlngs[:, 1], self.zone_number, self.zone_letter)
+        return np.column_stack((x, y))
+
+    @profiled("conversion")
+    def to_latlng_batch(self, points, strict=True):
+        """
+        Convert an array (N, 2) of (x, y) to an array (N, 2) of lat&lng.
+        In local mode, a point that is not the projection of a point of the
+        earth is converted to NaN, or raises a RuntimeError if strict.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self.mode == "utm":
+            lat, lng = utm.to_latlon(points[:, 0], points[:, 1], self.zone_number, self.zone_letter, strict=strict)
+            return np.column_stack((lat, lng))
+        # The point of the earth is origin + x.east + y.north + u.up, the root
+        # u (closest to 0) of the equation of the ellipsoid:
+        # (X^2 + Y^2) / a^2 + Z^2 / b^2 = 1
+        base = self.origin + points @ self.axes[:2]
+        up = self.axes[2]
+        weights = np.array([1, 1, 1 / (1 - E2)]) / A ** 2
+        qa = (weights * up * up).sum()
+        qb = 2 * (weights * base * up).sum(axis=-1)
+        qc = (weights * base * base).sum(axis=-1) - 1
+        with np.errstate(invalid="ignore"):
+            u = (-qb + np.sqrt(qb * qb - 4 * qa * qc)) / (2 * qa)
+        if strict and np.isnan(u).any():
+            raise RuntimeError("The point is too far from the reference point.")
+        X, Y, Z = (base + u[:, None] * up).T
+        # On the ellipsoid, the geodetic latitude is exact.
+        lat = np.degrees(np.arctan2(Z, (1 - E2) * np.hypot(X, Y)))
+        lng = np.degrees(np.arctan2(Y, X))
+        return np.column_stack((lat, lng))
+
+
+def _ecef(phi, lam):
+    """Return the ECEF coordinates (..., 3) of points of the ellipsoid, at latitude phi and longitude lam (radians)."""
+    n = A / np.sqrt(1 - E2 * np.sin(phi) ** 2)
+    return np.stack([
+        n * np.cos(phi) * np.cos(lam),
+        n * np.cos(phi) * np.sin(lam),
+        n * (1 - E2) * np.sin(phi),
+    ], axis=-1)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+"""
+Data shared by the tests.
+"""
+
+import json
+import unittest
+
+import synthetic
+
+
+class SummitsTestCase(unittest.TestCase):
+    """
+    Base of the tests on the summits of a picture (x, y coordinates on the map),
+    from left to right, with their projections on the picture. Their first 5
+    or 6 summits and projections are smaller cases.
+    """
+
+    summits = [(553, 410), (560, 221), (488, 145), (424, 22), (298, 104), (226, 174), (153, 50)]
+    projections = [356, 450, 563, 659, 804, 923, 972]
+
+
+def example_query(name="frankfurt"):
+    """Return the query of /locate/ of an example."""
+    with open("data/{}/info.json".format(name)) as f:
+        info = json.load(f)
+    return {"projections": info["projections"], "latlngs": info["latlngs"]}
+
+
+def synthetic_query(n=100, seed=1):
+    """Return the query of /locate/ of a synthetic case of n summits (100 take seconds to solve)."""
+    info = synthetic.generate_case(n, seed=seed)
+    return {"projections": info["projections"], "latlngs": info["latlngs"]}
@@ -20,6 +20,78 @@ def percentage_to_color(i):
     return (255 - 255 * i // 100, 255 - 255 * i // 100, 255, 255)
 
 
+# The colors of percentage_to_color for the percentages 0 to 100.
+PERCENTAGE_COLORS = np.array([percentage_to_color(i) for i in range(101)], dtype=np.uint8)
+
+
+def adaptive_errors(errorfun, dimensions, tolerance=0.1, cell=32):
+    """
+    Return the matrix of the errors of the pixels of a map of dimensions
+    (width, height), and the number of errors computed.
+    errorfun is called with arrays (M, 2) of pixels and returns the arrays (M,)
+    of their errors. They are computed on the corners of cells of 'cell' pixels,
+    and a cell is divided in four while the errors on its corners vary more than
+    tolerance times the distance of their minimum to the minimum error (that is,
+    near the minimum and across the edges of the area). The errors inside the
+    cells are then interpolated from their corners.
+    """
+    (width, height) = dimensions
+    matrix = np.full((width, height), np.nan)
+    evaluated = np.zeros((width, height), dtype=bool)
+
+    def evaluate(xs, ys):
+        "Compute the errors of the pixels (xs, ys) not computed yet, return all."
+        todo = ~evaluated[xs, ys]
+        if todo.any():
+            points = np.unique(np.stack((xs[todo], ys[todo]), axis=-1), axis=0)
+            matrix[points[:, 0], points[:, 1]] = np.asarray(errorfun(points), dtype=float)
+            evaluated[points[:, 0], points[:, 1]] = True
+        return matrix[xs, ys]
+
+    if width < 2 or height < 2:
+        xs, ys = np.meshgrid(range(width), range(height), indexing="ij")
+        evaluate(xs.ravel(), ys.ravel())
+        return matrix, evaluated.sum()
+
+    # The cells, as arrays of their bounds (x0, y0, x1, y1), corners included.
+    x0, y0 = (a.ravel() for a in np.meshgrid(range(0, width - 1, cell), range(0, height - 1, cell), indexing="ij"))
+    cells = np.stack((x0, y0, np.minimum(x0 + cell, width - 1), np.minimum(y0 + cell, height - 1)), axis=-1)
+    done = []
+    while len(cells):
+        x0, y0, x1, y1 = cells.T
+        corners = np.stack([evaluate(x0, y0), evaluate(x1, y0), evaluate(x0, y1), evaluate(x1, y1)])
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        best = np.nanmin(matrix[evaluated])
+        split = ((x1 - x0 > 1) | (y1 - y0 > 1)) & ~(high - low <= tolerance * (low - best))
+        done.append((cells[~split], corners[:, ~split]))
+        # Divide the other cells in four (or two along their longest side).
+        x0, y0, x1, y1 = cells[split].T
+        xm, ym = (x0 + x1) // 2, (y0 + y1) // 2
+        children = np.concatenate([
+            np.stack((x0, y0, xm, ym), axis=-1),
+            np.stack((xm, y0, x1, ym), axis=-1),
+            np.stack((x0, ym, xm, y1), axis=-1),
+            np.stack((xm, ym, x1, y1), axis=-1),
+        ])
+        # A cell one pixel wide (or high) only has two children.
+        cells = children[(children[:, 2] > children[:, 0]) & (children[:, 3] > children[:, 1])]
+
+    # Interpolate the errors of the pixels inside the cells from their corners.
+    interpolated = matrix.copy()
+    for cells, corners in done:
+        for (x0, y0, x1, y1), (c00, c10, c01, c11) in zip(cells, corners.T):
+            if x1 - x0 <= 1 and y1 - y0 <= 1:
+                continue
+            tx = (np.arange(x0, x1 + 1) - x0)[:, None] / (x1 - x0)
+            ty = (np.arange(y0, y1 + 1) - y0)[None, :] / (y1 - y0)
+            interpolated[x0:x1 + 1, y0:y1 + 1] = (
+                c00 * (1 - tx) * (1 - ty) + c10 * tx * (1 - ty) + c01 * (1 - tx) * ty + c11 * tx * ty
+            )
+    # The errors computed are exact.
+    interpolated[evaluated] = matrix[evaluated]
+    return interpolated, evaluated.sum()
+
+
 class Map:
     """
     A map on which to draw segments, points, etc.
@@ -176,71 +248,125 @@ class Map:
         self.draw_point(points[i+1], color=color)
         return self
 
-    def grey_out_region(self, testfun):
+    def paste_layer(self, layer, mask):
         """
-        Grey out the pixels for which textfun(x, y) is True.
+        Paste on the map, in one operation, the pixels of layer (an array
+        (height, width, channels) of colors) where mask (an array (height, width)
+        of booleans) is True.
         """
-        for x in range(0, self.dimensions[0]):
-            for y in range(0, self.dimensions[1]):
-                if testfun((x, y)):
-                    if self.y_origin == "bottom":
-                        y = self.dimensions[1] - y - 1
-                    else:
-                        y = y - 1
-                    newcolor = tuple(
-                        [max(i - 20, 0) for i in self.map.getpixel((x, y))]
-                    )
-                    self.draw.point((x, y), fill=newcolor)
+        layer = PILImage.fromarray(np.ascontiguousarray(layer, dtype=np.uint8))
+        if layer.mode != self.map.mode:
+            layer = layer.convert(self.map.mode)
+        mask = PILImage.fromarray(np.ascontiguousarray(mask, dtype=np.uint8) * 255, "L")
+        self.map.paste(layer, (0, 0), mask)
         return self
 
+    def grey_out_region(self, testfun, vectorized=False):
+        """
+        Grey out the pixels for which textfun(x, y) is True.
+        If vectorized is True, testfun is called once with the array (M, 2) of
+        all the pixels and must return the array (M,) of booleans (e.g.
+        tools.is_valid_location_batch).
+        """
+        (width, height) = self.dimensions
+        if vectorized:
+            points = np.stack(np.meshgrid(range(width), range(height), indexing="ij"), axis=-1)
+            mask = np.asarray(testfun(points.reshape(-1, 2)), dtype=bool).reshape(width, height)
+        else:
+            mask = np.array([[bool(testfun((x, y))) for y in range(height)] for x in range(width)])
+        # The pixel (x, y) greys out the row height - y - 1 from the bottom,
+        # or the row y - 1 from the top (none for y = 0).
+        rows = np.zeros((height, width), dtype=bool)
+        if self.y_origin == "bottom":
+            rows[:] = mask[:, ::-1].T
+        else:
+            rows[:-1] = mask[:, 1:].T
+        pixels = np.asarray(self.map)
+        return self.paste_layer(np.maximum(pixels.astype(int) - 20, 0), rows)
+
     def reset_color_matrix(self):
         """Reset the error matrix."""
         self.error_matrixes = {}
         return self
 
-    def compute_color_matrix(self, colorfun, incr=0):
+    def compute_color_matrix(self, colorfun, incr=0, vectorized=False, tolerance=None):
         """
         Compute, save and return the error matrix for colorfun.
+        If vectorized is True, colorfun is called once with the array (M, 2)
+        of all the points to evaluate and must return the array (M,) of errors.
+        If tolerance is set, the errors are sampled adaptively instead of every
+        2*incr+1 pixels (see adaptive_errors): the smaller, the more accurate.
         """
+        key = incr if tolerance is None else ("adaptive", tolerance)
         # First try to retrieve data from cache
-        if (colorfun in self.error_matrixes) and (incr in self.error_matrixes[colorfun]):
-            return  self.error_matrixes[colorfun][incr]
+        if (colorfun in self.error_matrixes) and (key in self.error_matrixes[colorfun]):
+            return  self.error_matrixes[colorfun][key]
+        if tolerance is not None:
+            if vectorized:
+                errorfun = colorfun
+            else:
+                errorfun = lambda points: [colorfun(tuple(p)) for p in points.tolist()]
+            matrix, count = adaptive_errors(errorfun, self.dimensions, tolerance)
+            error_min, error_max = np.nanmin(matrix), np.nanmax(matrix)
+            print("%d errors computed, error min, max: %f, %f" % (count, error_min, error_max))
+            self.error_matrixes.setdefault(colorfun, {})[key] = (matrix, error_min, error_max)
+            return  self.error_matrixes[colorfun][key]
         # For each group of pixels, compute the error, min and max
+        xs = range(incr, self.dimensions[0], 2*incr+1)
+        ys = range(incr, self.dimensions[1], 2*incr+1)
+        if vectorized:
+            points = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1)
+            errors = np.asarray(colorfun(points.reshape(-1, 2)), dtype=float)
+            errors = errors.reshape(len(xs), len(ys))
+        else:
+            errors = np.zeros((len(xs), len(ys)))
+            percentage, cur = 0, 0
+            total = len(xs) * len(ys)
+            for i, x in enumerate(xs):
+                for j, y in enumerate(ys):
+                    errors[i, j] = colorfun((x, y))
+                    cur += 1
+                    if 100 * cur / total > percentage:
+                        percentage += 1
+                        print(f"{percentage}% ", end="")
+            print()
+        # The pixels without an error (NaN) are ignored.
+        error_min, error_max = np.nanmin(errors), np.nanmax(errors)
+        print("error min, max: %f, %f" % (error_min, error_max))
+        # Each error is the value of the block of pixels around its point.
         matrix = np.zeros(self.dimensions)
-        error_min, error_max = 99999999999, 0
-        percentage, cur = 0, 0
-        total = len(range(incr, self.dimensions[0], 2*incr+1)) * len(range(incr, self.dimensions[1], 2*incr+1))
-        for x in range(incr, self.dimensions[0], 2*incr+1):
-            for y in range(incr, self.dimensions[1], 2*incr+1):
-                error = colorfun((x, y))
-                for i in range(-incr, incr + 1):
-                    for j in range(-incr, incr + 1):
-                        if x + i < self.dimensions[0] and y + j < self.dimensions[1]:
-                            matrix[x + i, y + j] = error
-                error_min = min(error_min, error)
-                error_max = max(error_max, error)
-                cur += 1
-                if 100 * cur / total > percentage:
-                    percentage += 1
-                    print(f"{percentage}% ", end="")
-        print("\nerror min, max: %f, %f" % (error_min, error_max))
+        blocks = np.repeat(np.repeat(errors, 2*incr+1, axis=0), 2*incr+1, axis=1)
+        blocks = blocks[:self.dimensions[0], :self.dimensions[1]]
+        matrix[:blocks.shape[0], :blocks.shape[1]] = blocks
         # Save data in cache
         self.error_matrixes.setdefault(colorfun, {})[incr] = (matrix, error_min, error_max)
         return  self.error_matrixes[colorfun][incr]
 
-    def hot_colorize(self, colorfun, transfun=lambda x: x, incr=0):
+    def hot_colorize(self, colorfun, transfun=lambda x: x, incr=0, vectorized=False, tolerance=None):
         """
         Colorize the map with the error value.
         incr is an unsigned int. The bigger, the faster and the less accurate.
         incr = 0 means every pixel is computed.
+        vectorized, tolerance: see compute_color_matrix.
+        transfun is applied to the array of the percentages of all the pixels.
+        The pixels without an error (NaN) are not colorized.
         """
-        (error_matrix, error_min, error_max) = self.compute_color_matrix(colorfun, incr)
+        (error_matrix, error_min, error_max) = self.compute_color_matrix(colorfun, incr, vectorized, tolerance)
         # Colorize map with normalized error
-        for x in range(self.dimensions[0]):
-            for y in range(self.dimensions[1]):
-                err = error_matrix[x, y]
-                percentage = 100 * (err - error_min) / (error_max - error_min)
-                percentage = max(0, min(100, transfun(percentage)))
-                color = percentage_to_color(percentage)
-                self.draw_pixel((x, y), color=color)
-        return self
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percentages = transfun(100 * (error_matrix - error_min) / (error_max - error_min))
+        percentages = np.asarray(percentages, dtype=float)
+        colorized = ~np.isnan(percentages)
+        colors = PERCENTAGE_COLORS[np.clip(np.nan_to_num(percentages), 0, 100).astype(int)]
+        # As with draw_pixel, the pixel (x, y) is on the row height - y from the
+        # bottom (none for y = 0), or on the row y from the top.
+        (width, height) = self.dimensions
+        layer = np.zeros((height, width, 4), dtype=np.uint8)
+        mask = np.zeros((height, width), dtype=bool)
+        if self.y_origin == "bottom":
+            layer[1:] = colors[:, :0:-1].transpose(1, 0, 2)
+            mask[1:] = colorized[:, :0:-1].T
+        else:
+            layer[:] = colors.transpose(1, 0, 2)
+            mask[:] = colorized.T
+        return self.paste_layer(layer, mask)
@@ -5,57 +5,328 @@ Algorithm to locate the photographer.
 This algorithm relies on multiple execution of another optimizer.
 """
 
+import itertools
+import os
+import random
+import time
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from math import inf
 
-from optimizer import compute_projection_on_picture
+import numpy as np
+
+from converter import Converter
+from optimizer import compute_projection_on_picture, latlng_callback, optimize_picture, projection_residuals
 from optimizer import find_photographer as find_photographer_basic
-from tools import barycenter, selections_of_five_summits
+from tools import barycenter, count_selections_of_summits, distance, halton, is_in_envelop_batch
+from tools import photographer_area, selections_of_summits
 
 
 MetaPhotographerPosition = namedtuple('MetaPhotographer', ["photographer", "error", "details"])
 
 
-def find_photographer_for_5(summits, projections, init=None):
+def _find_photographer_for_combination(summits, projections, init, options, comb):
     """
-    Position the photographer where the picture was taken for
-    all possible combinations of 5 summits.
+    Position the photographer with the summits of indexes 'comb' only.
+    Return None if such a picture cannot be taken.
     """
-    # Takes 'middle' of area where the photographer can be as start of search
-    combinations = selections_of_five_summits(summits)
-    counter = 0
-    details = []
-    print("Combinations of summits: ", end="")    
-    for comb in combinations:
-        counter += 1
-        print("%i/%i" % (counter, len(combinations)), end=" ")
-        # Find the best position for the photographer
-        photographer, error, path, area, init = find_photographer_basic(
+    try:
+        return find_photographer_basic(
             summits=[summits[i] for i in comb],
             projections=[projections[i] for i in comb],
-            init=init
+            init=init,
+            **options
         )
-        details.append({
-            "photographer": photographer,
-            "error": error,
-            "path": path,
-            "summits": summits,
-            "projections": projections
-        })
-    print()
-    # Compute barycenter weighted on inverse error
+    except RuntimeError:
+        return None
+
+
+def _inliers(photographer, summits, projections, comb, threshold, engine="slsqp"):
+    """
+    Return the indexes of the summits whose projections are consistent with the
+    position of the photographer and of the picture computed with the summits 'comb'.
+    engine: the solver used to position the picture (see optimize_picture).
+    """
+    alpha = optimize_picture(
+        tuple(photographer),
+        [summits[i] for i in comb],
+        [projections[i] for i in comb],
+        engine=engine
+    ).alpha
+    residuals = projection_residuals(photographer, alpha, summits, projections, comb[0], comb[-1])
+    return [i for i, r in enumerate(residuals) if abs(r) <= threshold]
+
+
+def find_photographer_for_combinations(summits, projections, init=None, strategy="exhaustive", budget=None,
+                                       threshold=0.01, consensus=0.9, warm_start=False, seed=0,
+                                       size=5, shard=None, skip=(),
+                                       workers=None, chunksize=4, progress=None, **options):
+    """
+    Position the photographer where the picture was taken for
+    combinations of 'size' summits (5 by default).
+    shard and skip restrict the combinations (see selections_of_summits), e.g.
+    to split the work between machines or to resume it.
+    The strategy defines the combinations solved:
+     - "exhaustive": all combinations, the photographer is the barycenter of
+       their results weighted on the inverse of their errors
+     - "random": 'budget' combinations drawn at random (with 'seed'), same result
+     - "ransac": combinations drawn at random until one of them is consistent
+       with 'consensus' of the summits (their projections are within 'threshold'
+       of the width of the picture), or 'budget' combinations are solved.
+       The photographer is then found with the summits consistent with the best
+       combination. This is robust to mislabeled summits.
+    If warm_start is True, the combinations are solved by rounds, each of them
+    starting from the best position found by the previous rounds.
+    The combinations are solved in parallel by 'workers' processes (as many
+    as CPUs if None, in the current process if 1), that receive them by
+    chunks of 'chunksize'. The results are in the order of the combinations.
+    progress is an optional function called with the number of combinations
+    solved and the total number of combinations, after each combination.
+    The options are passed to the optimizer (see find_photographer).
+    """
+    selections = partial(selections_of_summits, summits, size, shard, skip)
+    if strategy == "exhaustive":
+        # The combinations are generated lazily, while they are solved.
+        total = count_selections_of_summits(summits, size, shard, skip)
+        combinations = selections()
+    elif strategy in ("random", "ransac"):
+        combinations = list(selections())
+        combinations = random.Random(seed).sample(combinations, len(combinations))
+        total = len(combinations)
+    else:
+        raise RuntimeError("Unknown strategy: {}".format(strategy))
+    if budget is not None:
+        total = min(total, budget)
+        combinations = itertools.islice(combinations, budget)
+    combinations = iter(combinations)
+    # Combinations are solved by rounds: results are needed before the end to
+    # warm start or to stop early, otherwise rounds only bound the number of
+    # combinations generated ahead of their solve.
+    roundsize = (workers or os.cpu_count() or 1) * chunksize
+    if not warm_start and strategy != "ransac":
+        roundsize *= 16
+
+    def better(detail, best):
+        if strategy == "ransac":
+            return (len(detail["inliers"]), -detail["error"]) > (len(best["inliers"]), -best["error"])
+        return detail["error"] < best["error"]
+
+    details = []
+    best = None
+    done = 0
+    with nullcontext() if workers == 1 else ProcessPoolExecutor(workers) as pool:
+        while batch := list(itertools.islice(combinations, roundsize)):
+            batch_init = best["photographer"] if warm_start and best is not None else init
+            solve = partial(_find_photographer_for_combination, summits, projections, batch_init, options)
+            if pool is None:
+                results = map(solve, batch)
+            else:
+                results = pool.map(solve, batch, chunksize=chunksize)
+            for comb, result in zip(batch, results):
+                done += 1
+                if result is not None:
+                    photographer, error = result.photographer, result.error
+                    # The paths are not kept: there may be many combinations.
+                    detail = {
+                        "photographer": photographer,
+                        "error": error,
+                        "combination": comb,
+                        "summits": summits,
+                        "projections": projections
+                    }
+                    if strategy == "ransac":
+                        detail["inliers"] = _inliers(photographer, summits, projections, comb, threshold,
+                                                     options.get("engine", "slsqp"))
+                    details.append(detail)
+                    if best is None or better(detail, best):
+                        best = detail
+                if progress is not None:
+                    progress(done, total)
+            if strategy == "ransac" and best is not None \
+                    and len(best["inliers"]) >= consensus * len(summits):
+                break
+    if best is None:
+        raise RuntimeError(
+            "Such a picture cannot be taken. "
+            "Check the location and order of the points on the map and picture."
+        )
+    if strategy == "ransac":
+        # Position the photographer with all the summits consistent with the best
+        # combination, if there are enough of them (i.e. at least 3).
+        inliers = best["inliers"]
+        if len(inliers) < 3:
+            return MetaPhotographerPosition(photographer=best["photographer"], error=best["error"], details=details)
+        result = _find_photographer_for_combination(
+            summits, projections, tuple(best["photographer"]), options, inliers
+        )
+        if result is None:
+            return MetaPhotographerPosition(photographer=best["photographer"], error=best["error"], details=details)
+        return MetaPhotographerPosition(photographer=result.photographer, error=result.error, details=details)
+    # Compute barycenter weighted on inverse error (of the exact results only, if any)
+    weighted = [i for i in details if i["error"] == 0] or details
     bary = barycenter(
-        points=[i["photographer"] for i in details],
-        weights=[1 / i["error"] for i in details]
+        points=[i["photographer"] for i in weighted],
+        weights=[1 if i["error"] == 0 else 1 / i["error"] for i in weighted]
     )
     error = sum(i["error"] for i in details)
     return MetaPhotographerPosition(photographer=bary, error=error, details=details)
 
 
+# The former name, from when the combinations were of 5 summits only.
+find_photographer_for_5 = find_photographer_for_combinations
+
+
+def multistart_inits(area, samples=16, shrink=0.1):
+    """
+    Return the initial positions of a multi-start search in the area (a convex
+    envelop, see photographer_area): its barycenter, its corners (moved by
+    'shrink' of the way to the barycenter, to be within the area), and at most
+    'samples' positions of the Halton sequence within the area.
+    """
+    center = barycenter(area)
+    inits = [center] + [(x + shrink * (center[0] - x), y + shrink * (center[1] - y)) for (x, y) in area]
+    if samples > 0:
+        xs, ys = [p[0] for p in area], [p[1] for p in area]
+        lows, highs = np.array((min(xs), min(ys))), np.array((max(xs), max(ys)))
+        # The sequence covers the box of the area, the positions out of the area are skipped.
+        points = lows + halton(64 * samples) * (highs - lows)
+        points = points[is_in_envelop_batch(points, area)][:samples]
+        inits += [tuple(p) for p in points.tolist()]
+    return inits
+
+
+def _find_photographer_from(summits, projections, options, deadline, init):
+    """
+    Run the optimizer from init, until deadline (a time.monotonic() time, if
+    not None). Return None if such a picture cannot be taken, and False if
+    the deadline is passed before the search is started.
+    """
+    if deadline is not None:
+        max_time = deadline - time.monotonic()
+        if max_time <= 0:
+            return False
+        options = dict(options, max_time=max_time)
+    try:
+        return find_photographer_basic(summits, projections, init=init, **options)
+    except RuntimeError:
+        # The optimizer also checks the time before the search.
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        return None
+
+
+MultiStartPosition = namedtuple('MultiStartPosition', ["photographer", "error", "minima", "area"])
+
+
+def find_photographer_multistart(summits, projections, samples=16, separation=0.02,
+                                 workers=None, chunksize=1, **options):
+    """
+    Position the photographer with searches started from positions spread over
+    the area where the photographer can be (see multistart_inits), to find
+    the distinct local minima of the error.
+    The searches that converge within 'separation' of the size of the scene
+    (the largest distance from the barycenter of the summits to a summit) of
+    a better one are merged into its minimum.
+    The searches run in parallel on 'workers' processes (as many as CPUs if
+    None, in the current process if 1), that receive them by chunks of
+    'chunksize'.
+    The options are passed to the optimizer (see find_photographer). A
+    callback gets the best position of all the searches so far (it requires
+    workers=1), and once it returns True, no search is started anymore.
+    max_time bounds the duration of all the searches: they stop, or are
+    skipped, once it is reached (and if all of them are skipped, a
+    RuntimeError tells that the time budget is exhausted).
+    Output:
+    - The best 'photographer' position and its 'error'
+    - The 'minima', from the best to the worst: dicts with their 'photographer'
+      position, their 'error', the 'init' of their best search and the number
+      of searches that converged to them ('starts')
+    - The 'area' in which the photographer can be located
+    """
+    area = photographer_area(summits)
+    inits = multistart_inits(area, samples)
+    max_time = options.pop("max_time", None)
+    deadline = None if max_time is None else time.monotonic() + max_time
+    callback = options.get("callback")
+    stopped = False
+    if callback is not None:
+        if workers != 1:
+            raise RuntimeError("A callback requires workers=1.")
+        best = {"photographer": None, "error": inf}
+        def bestcallback(photographer, error):
+            nonlocal stopped
+            if error < best["error"]:
+                best.update(photographer=photographer, error=error)
+            stopped = stopped or bool(callback(best["photographer"], best["error"]))
+            return stopped
+        options = dict(options, callback=bestcallback)
+    solve = partial(_find_photographer_from, summits, projections, options, deadline)
+    results = []
+    skipped = 0
+    with nullcontext() if workers == 1 else ProcessPoolExecutor(workers) as pool:
+        for result in map(solve, inits) if pool is None else pool.map(solve, inits, chunksize=chunksize):
+            if result is False:
+                skipped += 1
+            elif result is not None:
+                results.append(result)
+            if stopped:
+                break
+    if not results and skipped == len(inits):
+        raise RuntimeError(
+            "The time budget is exhausted before any search is started. "
+            "Increase max_time."
+        )
+    if not results:
+        raise RuntimeError(
+            "Such a picture cannot be taken. "
+            "Check the location and order of the points on the map and picture."
+        )
+    center = barycenter(summits)
+    radius = separation * max(distance(center, p) for p in summits)
+    minima = []
+    for result in sorted(results, key=lambda r: r.error):
+        photographer = tuple(float(x) for x in result.photographer)
+        for minimum in minima:
+            if distance(minimum["photographer"], photographer) <= radius:
+                minimum["starts"] += 1
+                break
+        else:
+            minima.append({"photographer": photographer, "error": float(result.error),
+                           "init": tuple(result.init), "starts": 1})
+    return MultiStartPosition(photographer=minima[0]["photographer"], error=minima[0]["error"],
+                              minima=minima, area=area)
+
+
+def find_photographer_multistart_wsg84(latlngs, projections, mode="utm", **options):
+    """
+    Wrapper of find_photographer_multistart that uses latlngs in input & output
+    instead of x,y coordinates.
+    mode: the (x, y) coordinates used by the optimizer (see Converter).
+    """
+    conv = Converter(*latlngs[0], mode=mode)
+    utmsummits = [tuple(p) for p in conv.from_latlng_batch(latlngs).tolist()]
+    if options.get("callback") is not None:
+        options["callback"] = latlng_callback(conv, options["callback"])
+    res = find_photographer_multistart(utmsummits, projections, **options)
+    minima = [dict(m, photographer=conv.to_latlng(*m["photographer"], strict=False),
+                   init=conv.to_latlng(*m["init"], strict=False)) for m in res.minima]
+    area = [tuple(p) for p in conv.to_latlng_batch(res.area, strict=False).tolist()]
+    return MultiStartPosition(photographer=minima[0]["photographer"], error=minima[0]["error"],
+                              minima=minima, area=area)
+
+
 def run(map, summits, projections):
     """
     Run the optimization and display findings on map.
     """
-    res = find_photographer_for_5(summits, projections)
+    res = find_photographer_for_combinations(
+        summits,
+        projections,
+        progress=lambda done, total: print("\rCombinations of summits: %i/%i" % (done, total), end="")
+    )
+    print()
     positions = res.details
     sortedPositions = sorted(positions, key=lambda p: p["error"])
     for i,  p in enumerate(sortedPositions):
@@ -4,14 +4,17 @@
 Algorithm to locate the photographer.
 """
 
+import time
 from collections import namedtuple
-from math import fabs, sqrt
+from math import atan2, degrees, fabs, inf, log, sqrt
 
 import utm
+import numpy as np
 from numpy import array
-from scipy.optimize import minimize
+from scipy.optimize import least_squares, minimize
 
-from tools import barycenter, distance, extrems, intersection_lines, photographer_area
+from profiling import count, profiled, stage
+from tools import barycenter, det_batch, distance, extrems, intersection_lines, is_valid_location_batch, photographer_area
 from converter import Converter
 
 
@@ -60,16 +63,82 @@ def compute_projection_on_picture(photographer, summits, alpha, rho=1):
     return [s1_] + s2toM_ + [sN_]
 
 
+def _summit_dets_batch(photographers, summits):
+    """
+    With u = s - p for each summit s, return det(u, s1 - p) and det(u, sN - p)
+    as two arrays (N, ...) for an array (..., 2) of photographers.
+    """
+    p = np.asarray(photographers, dtype=float)
+    u = np.asarray(summits, dtype=float).reshape((-1,) + (1,) * (p.ndim - 1) + (2,)) - p
+    return det_batch(u, u[0]), det_batch(u, u[-1])
+
+
+def _picture_errors_batch(c, d, deltasref, alphas):
+    """
+    Vectorized error of optimize_picture, from the determinants of the summits
+    (see _summit_dets_batch) and an array of alphas broadcastable with c[0].
+    The projection of a summit lies at t = alpha.c / (alpha.c - (1 - alpha).d)
+    along the picture, from s1_ (t = 0) to sN_ (t = 1).
+    """
+    alphas = np.asarray(alphas, dtype=float)
+    count("evaluation", alphas.size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = alphas * c / (alphas * c - (1 - alphas) * d)
+    t[0], t[-1] = 0, 1
+    # All projections are on a line: the extrems are the projections with the
+    # min and max abscissa along that line.
+    tmin = t.min(axis=0)
+    tmax = t.max(axis=0)
+    # Compute the error: normalized sum of square of diff of the normalized distance
+    with np.errstate(divide="ignore", invalid="ignore"):
+        orientation = alphas * (1 - alphas) * -c[-1] * (tmax - tmin)
+        tleft = np.where(orientation <= 0, tmin, tmax)
+        deltascur = np.abs(t - tleft) / (tmax - tmin)
+        error = ((deltascur - deltasref) ** 2).sum(axis=0) / len(deltasref)
+    # If a summit doesn't have any projection, return max error.
+    return np.where(np.isfinite(error), error, 999999)
+
+
+def _optimize_alpha_batch(photographers, summits, deltasref, samples=33, refine=9, xtol=1e-8):
+    """
+    Find, for each photographer, the alpha that minimizes the error of the picture.
+    The range of alpha is first sampled with 'samples' values at once, then
+    narrowed with 'refine' values around the best sample until its width is
+    below xtol.
+    Return the arrays of the best alphas and of their errors.
+    """
+    c, d = _summit_dets_batch(np.asarray(photographers, dtype=float)[..., None, :], summits)
+    deltasref = np.asarray(deltasref, dtype=float).reshape((-1,) + (1,) * (c.ndim - 1))
+    lo = np.zeros(c.shape[1:-1])
+    hi = np.ones(c.shape[1:-1])
+    grid = np.linspace(0, 1, samples)
+    while True:
+        alphas = np.minimum(lo[..., None] + (hi - lo)[..., None] * grid, hi[..., None])
+        errors = _picture_errors_batch(c, d, deltasref, alphas)
+        best = np.argmin(errors, axis=-1)[..., None]
+        alpha = np.take_along_axis(alphas, best, axis=-1)[..., 0]
+        error = np.take_along_axis(errors, best, axis=-1)[..., 0]
+        step = (hi - lo) / (len(grid) - 1)
+        if np.all(step <= xtol):
+            return alpha, error
+        lo = np.maximum(alpha - step, 0)
+        hi = np.minimum(alpha + step, 1)
+        grid = np.linspace(0, 1, refine)
+
+
 PicturePosition = namedtuple('PicturePosition', ["projections", "alpha", "rho", "error"])
 
 
-def optimize_picture(photographer, summits, projections):
+@profiled("picture")
+def optimize_picture(photographer, summits, projections, engine="slsqp"):
     """
     Optimize the position of the picture for a given position of the photographer.
     Input:
      - the position of the photographer (p)
      - the positions of at least three summits on the map (as viewed from left to right)
      - the projections of the summits on the picture (from left to right)
+     - engine: the solver used to find alpha, either "slsqp" (scipy) or
+       "vectorized" (all alphas of a bracket evaluated at once with numpy)
     Output:
      - error: the error on the alignment of the summits after optimization
      - alpha/rho: two parameters that define the position of the picture
@@ -91,6 +160,7 @@ def optimize_picture(photographer, summits, projections):
         # of the summit), return max error.
         if None in s_:
             return 999999
+        count("evaluation")
         # Compute successive normalized distance between projections
         left, right = extrems(photographer, s_)
         deltascur = [
@@ -106,14 +176,20 @@ def optimize_picture(photographer, summits, projections):
 
     # find the values of alpha that minimise the distances between expected
     # and actual projections of the summits on the lens.
-    res = minimize(
-        errorfun,
-        (0.5,),
-        method='SLSQP',
-        bounds=((0, 1),)
-    )
-    alpha = res.x[0]
-    error = res.fun
+    if engine == "slsqp":
+        res = minimize(
+            errorfun,
+            (0.5,),
+            method='SLSQP',
+            bounds=((0, 1),)
+        )
+        alpha = res.x[0]
+        error = res.fun
+    elif engine == "vectorized":
+        alpha, error = _optimize_alpha_batch(photographer, summits, deltasref)
+        alpha, error = float(alpha), float(error)
+    else:
+        raise RuntimeError("Unknown engine: {}".format(engine))
     # move picture away/closer to have respect scale
     s_ = compute_projection_on_picture(photographer, summits, alpha)
     if distance(s_[1], s_[0]) == 0:
@@ -125,20 +201,533 @@ def optimize_picture(photographer, summits, projections):
     return PicturePosition(projections=s__ , alpha=alpha, rho=rho, error=error)
 
 
+def projection_residuals(photographer, alpha, summits, projections, left=0, right=-1):
+    """
+    Return the residuals of the projections of all the summits on a picture.
+    Input:
+     - photographer: the position of the photographer
+     - alpha: the position of the picture, for the summits of indexes 'left' and
+       'right' taken as the first and last summits (see compute_projection_on_picture)
+     - summits: the positions of the summits on the map
+     - projections: the projections of the summits on the picture
+    Output:
+     - the array of the differences between the projections of the summits on
+       the picture and 'projections', normalized by the width of the picture.
+    """
+    u = np.asarray(summits, dtype=float) - np.asarray(photographer, dtype=float)
+    c, d = det_batch(u, u[left]), det_batch(u, u[right])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = alpha * c / (alpha * c - (1 - alpha) * d)
+    t[left], t[right] = 0, 1
+    projections = np.asarray(projections, dtype=float)
+    computed = projections[left] + t * (projections[right] - projections[left])
+    return (computed - projections) / (projections[-1] - projections[0])
+
+
+def _abscissas_and_jacobian(photographer, alpha, summits):
+    """
+    Return the abscissas t of the projections of the summits on the picture
+    (see _picture_errors_batch), with their jacobian (N, 3) along (x, y, alpha).
+    With D = alpha.c - (1 - alpha).d, the abscissa t = alpha.c / D of a
+    projection has the derivatives:
+     - dt/dalpha = -c.d / D^2
+     - dt/dc = -alpha.(1 - alpha).d / D^2 and dt/dd = alpha.(1 - alpha).c / D^2
+     - dc/dp = (uy - ay, ax - ux), dd/dp = (uy - by, bx - ux), with u = s - p,
+       a = s1 - p and b = sN - p.
+    Also return c, and u = s - p.
+    """
+    p = np.asarray(photographer, dtype=float)
+    u = np.asarray(summits, dtype=float) - p
+    a, b = u[0], u[-1]
+    c, d = det_batch(u, a), det_batch(u, b)
+    dc = np.stack([u[:, 1] - a[1], a[0] - u[:, 0]], axis=-1)
+    dd = np.stack([u[:, 1] - b[1], b[0] - u[:, 0]], axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        D = alpha * c - (1 - alpha) * d
+        t = alpha * c / D
+        jac = np.empty((len(u), 3))
+        jac[:, :2] = alpha * (1 - alpha) * (c[:, None] * dd - d[:, None] * dc) / D[:, None] ** 2
+        jac[:, 2] = -c * d / D ** 2
+    t[0], t[-1] = 0, 1
+    jac[0], jac[-1] = 0, 0
+    return t, jac, c, u
+
+
+def picture_error_and_gradient(photographer, alpha, summits, projections):
+    """
+    Return the error of the picture (see optimize_picture) for a position of
+    the photographer and a value of alpha, with its gradient along (x, y, alpha)
+    (see _abscissas_and_jacobian).
+    """
+    count("evaluation")
+    projections = np.asarray(projections, dtype=float)
+    deltasref = (projections - projections[0]) / (projections[-1] - projections[0])
+    t, jac, c, _ = _abscissas_and_jacobian(photographer, alpha, summits)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # The projections are measured from the leftmost one (see _picture_errors_batch)
+        imin, imax = np.argmin(t), np.argmax(t)
+        width = t[imax] - t[imin]
+        if alpha * (1 - alpha) * -c[-1] * width <= 0:
+            ileft, sign = imin, 1
+        else:
+            ileft, sign = imax, -1
+        deltascur = sign * (t - t[ileft]) / width
+        ddeltas = (sign * (jac - jac[ileft]) - deltascur[:, None] * (jac[imax] - jac[imin])) / width
+        residuals = deltascur - deltasref
+        error = (residuals ** 2).sum() / len(deltasref)
+        gradient = 2 * residuals @ ddeltas / len(deltasref)
+    # If a summit doesn't have any projection, return max error.
+    if not np.isfinite(error) or not np.all(np.isfinite(gradient)):
+        return 999999, np.zeros(3)
+    return float(error), gradient
+
+
+def photographer_residuals(params, summits, projections):
+    """
+    Return the residuals of the projections of the summits on a picture, with
+    their jacobian.
+    Input:
+     - params: (x, y, alpha, rho), the position of the photographer and of the
+       picture, rho being the scale of the picture (in units of the projections
+       per unit of the map, see compute_projection_on_picture)
+     - summits: the positions of the summits on the map
+     - projections: the projections of the summits on the picture
+    Output:
+     - the array (N) of the differences between the projections of the summits
+       on the picture (measured from the first one) and 'projections',
+       normalized by the width of the picture
+     - the jacobian (N, 4) of the residuals along (x, y, alpha, rho)
+    The projection of a summit is at rho.L.t from the first one, with L the
+    length of the picture for rho = 1: L = |w| with w = alpha.a - (1 - alpha).b,
+    so dL/dp = (1 - 2.alpha).w / L and dL/dalpha = w.(a + b) / L.
+    """
+    count("evaluation")
+    x, y, alpha, rho = params
+    projections = np.asarray(projections, dtype=float)
+    width = projections[-1] - projections[0]
+    t, jact, _, u = _abscissas_and_jacobian((x, y), alpha, summits)
+    a, b = u[0], u[-1]
+    w = alpha * a - (1 - alpha) * b
+    length = sqrt(w @ w)
+    dlength = np.array([*((1 - 2 * alpha) * w / length), w @ (a + b) / length])
+    residuals = (projections[0] + rho * length * t - projections) / width
+    jac = np.empty((len(t), 4))
+    jac[:, :3] = rho * (length * jact + t[:, None] * dlength) / width
+    jac[:, 3] = length * t / width
+    return residuals, jac
+
+
+def optimize_picture_batch(photographers, summits, projections, chunksize=1024):
+    """
+    Vectorized optimize_picture for an array (..., 2) of positions of the photographer.
+    The positions are processed by chunks of 'chunksize' to bound the memory used.
+    Output:
+     - alphas: the array (...) of the best alpha for each position
+     - errors: the array (...) of the error for each position
+    """
+    photographers = np.asarray(photographers, dtype=float)
+    deltasref = [
+        (p - projections[0]) / (projections[-1] - projections[0])
+        for p in projections
+    ]
+    positions = photographers.reshape(-1, 2)
+    alphas = np.empty(len(positions))
+    errors = np.empty(len(positions))
+    for i in range(0, len(positions), chunksize):
+        alphas[i:i + chunksize], errors[i:i + chunksize] = _optimize_alpha_batch(
+            positions[i:i + chunksize], summits, deltasref
+        )
+    shape = photographers.shape[:-1]
+    return alphas.reshape(shape), errors.reshape(shape)
+
+
+ErrorGrid = namedtuple('ErrorGrid', ["xs", "ys", "errors"])
+
+
+def error_grid(summits, projections, bounds, resolution):
+    """
+    Compute the error of the photographer on every point of a grid.
+    Input:
+    - summits: list of (x, y) coordinates of the summits on the map
+    - projections: distance of the projections of the summits from the left of the picture
+    - bounds: the (xmin, xmax, ymin, ymax) limits of the grid
+    - resolution: the number (nx, ny) of points of the grid along x and y
+    Output:
+    - 'xs' and 'ys', the coordinates of the columns and rows of the grid
+    - the 'errors' matrix (nx, ny), errors[i, j] being the error at (xs[i], ys[j])
+    """
+    xmin, xmax, ymin, ymax = bounds
+    nx, ny = resolution
+    xs = np.linspace(xmin, xmax, nx)
+    ys = np.linspace(ymin, ymax, ny)
+    grid = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1)
+    _, errors = optimize_picture_batch(grid, summits, projections)
+    return ErrorGrid(xs=xs, ys=ys, errors=errors)
+
+
+@profiled("grid")
+def grid_candidates(summits, projections, area, budget=1000, levels=3, candidates=3, deadline=None):
+    """
+    Search the best positions of the photographer by sampling the error from
+    coarse to fine: the area is sampled on a coarse grid, then each following
+    level samples a finer grid around the best cells of the previous one.
+    Input:
+    - summits: list of (x, y) coordinates of the summits on the map
+    - projections: distance of the projections of the summits from the left of the picture
+    - area: the envelop of the area where the photographer can be located
+    - budget: the total number of positions where the error is computed
+    - levels: the number of levels of sampling
+    - candidates: the number of best cells refined at each level
+    - deadline: an optional time (of time.monotonic) after which no finer
+      level is sampled
+    Output:
+    - the list of (at most 'candidates') best positions, the best first
+    - the size of the cells of the last grid sampled, along x and y
+    """
+    xs, ys = [p[0] for p in area], [p[1] for p in area]
+    centers = np.array([((min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2)])
+    halfsize = np.array([(max(xs) - min(xs)) / 2, (max(ys) - min(ys)) / 2])
+    best = np.empty((0, 2))
+    for level in range(levels):
+        if level > 0 and deadline is not None and time.monotonic() >= deadline:
+            break
+        # A grid centered on each of the best positions, clipped to the area
+        n = max(2, int(sqrt(budget / levels / len(centers))))
+        offsets = np.linspace(-1, 1, n)
+        grid = np.stack(np.meshgrid(offsets, offsets, indexing="ij"), axis=-1).reshape(-1, 2)
+        points = (centers[:, None, :] + grid * halfsize).reshape(-1, 2)
+        points = points[is_valid_location_batch(points, summits)]
+        if len(points) == 0:
+            break
+        _, errors = optimize_picture_batch(points, summits, projections)
+        best = points[np.argsort(errors, kind="stable")[:candidates]]
+        # Next level samples the cells around the best positions
+        centers = best
+        halfsize = halfsize * 2 / (n - 1)
+    return [tuple(p) for p in best], tuple(halfsize)
+
+
+class PathRecorder:
+    """
+    Record the positions evaluated by a search in a preallocated array.
+    One position out of 'decimation' is recorded. When 'maxlen' positions are
+    recorded, one out of two is dropped and the decimation is doubled, so that
+    the path keeps its shape with at most 'maxlen' positions.
+    """
+
+    def __init__(self, maxlen=1024, decimation=1):
+        if maxlen < 2 or decimation < 1:
+            raise RuntimeError("A path requires maxlen >= 2 and decimation >= 1.")
+        self.positions = np.empty((maxlen, 2))
+        self.decimation = decimation
+        self.length = 0
+        self.count = 0
+
+    def append(self, position):
+        """Record the position of the count-th evaluation (if not decimated)."""
+        if self.count % self.decimation == 0 and self.length == len(self.positions):
+            kept = self.positions[:self.length:2]
+            self.length = len(kept)
+            self.positions[:self.length] = kept
+            self.decimation *= 2
+        if self.count % self.decimation == 0:
+            self.positions[self.length] = position[0], position[1]
+            self.length += 1
+        self.count += 1
+
+    def array(self):
+        """Return the array (n, 2) of the positions recorded."""
+        return self.positions[:self.length]
+
+
+class SearchStopped(Exception):
+    """Raised by SearchProgress to stop a search."""
+
+
+class SearchProgress:
+    """
+    Track the best position found by a search, and report it to 'callback'
+    (if any) after each evaluation: callback(photographer, error) gets the best
+    position so far and its error. The search is stopped (with a SearchStopped
+    exception) if the callback returns True, after 'max_evaluations'
+    evaluations, or 'max_time' seconds after the creation of the progress.
+    """
+
+    def __init__(self, callback=None, max_evaluations=None, max_time=None):
+        self.callback = callback
+        self.max_evaluations = max_evaluations
+        self.deadline = None if max_time is None else time.monotonic() + max_time
+        self.evaluations = 0
+        self.photographer = None
+        self.error = np.inf
+        self.key = np.inf
+        self.init = None
+        self.start = None
+
+    def restart(self, init):
+        """
+        Record the initial position of the search in progress, the search is
+        stopped if the time is up (see check).
+        """
+        self.start = init
+        self.check()
+
+    def check(self):
+        """Stop the search (with a SearchStopped exception) if the time is up."""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise SearchStopped()
+
+    def update(self, photographer, error, key=None):
+        """
+        Report the evaluation of a position and its error. key is the value
+        minimized by the search (the error by default), and error may only be
+        given if key improves on the best one.
+        """
+        key = error if key is None else key
+        if key < self.key:
+            self.photographer = (float(photographer[0]), float(photographer[1]))
+            self.error, self.key, self.init = float(error), key, self.start
+        self.evaluations += 1
+        if self.callback is not None and self.callback(self.photographer, self.error):
+            raise SearchStopped()
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            raise SearchStopped()
+        self.check()
+
+
+def _step_callback(precision):
+    """
+    Return a callback of minimize or least_squares that stops the search once
+    an iteration moves the position (x, y) by less than precision (None if
+    precision is None).
+    """
+    if precision is None:
+        return None
+    last = []
+    def callback(intermediate_result):
+        position = np.array(intermediate_result.x[:2])
+        if last and distance(last[0], position) < precision:
+            raise StopIteration
+        last[:] = [position]
+    return callback
+
+
 PhotographerPosition = namedtuple('PhotographerPosition', ["photographer", "error", "path", "area", "init"])
 
 
-def find_photographer(summits, projections, init=None):
+def _find_photographer_nested(summits, projections, inits, simplexes, engine, path, progress, precision=None):
+    """
+    Minimize the error of the best picture with Nelder-Mead from each initial
+    position, return the best result with its initial position.
+    The positions evaluated are appended to path (a PathRecorder, or None) and
+    reported to progress (a SearchProgress, or None).
+    precision: if not None, a search stops once its simplex is smaller than it.
+    """
+    def errorfun(position):
+        "Error function to minimize."
+        error = optimize_picture(tuple(position), summits, projections, engine).error
+        if path is not None:
+            path.append(position)
+        if progress is not None:
+            progress.update(position, error)
+        return error
+
+    options = {}
+    if precision is not None:
+        options = {"xatol": precision, "fatol": inf}
+    # Minimize error function from each initial position, keep the best
+    best = None
+    for init, simplex in zip(inits, simplexes):
+        if progress is not None:
+            progress.restart(init)
+        res = minimize(
+            errorfun,
+            init,
+            method="Nelder-Mead",
+            options={"initial_simplex": simplex, **options}
+        )
+        if best is None or res.fun < best[0].fun:
+            best = (res, init)
+    return best
+
+
+def _find_photographer_joint(summits, projections, inits, area, path, progress, precision=None):
+    """
+    Minimize the error of the picture along (x, y, alpha) with L-BFGS-B from
+    each initial position, return the best result with its initial position.
+    The (normalized) positions evaluated are appended to path (a PathRecorder,
+    or None), and denormalized at the end. They are reported to progress (a
+    SearchProgress, or None).
+    precision: if not None, a search stops once an iteration moves the
+    position by less than it.
+    """
+    # The error is invariant by similarity: the search runs on coordinates
+    # normalized on the area, so that x, y and alpha have similar scales.
+    center = barycenter(area)
+    scale = max(distance(center, p) for p in area) or 1
+    normalized = [((x - center[0]) / scale, (y - center[1]) / scale) for (x, y) in summits]
+
+    def errorfun(z):
+        "Error function to minimize, with its gradient."
+        if path is not None:
+            path.append(z)
+        error, gradient = picture_error_and_gradient(z[:2], z[2], normalized, projections)
+        if progress is not None:
+            progress.update((center[0] + z[0] * scale, center[1] + z[1] * scale), error)
+        if error == 999999:
+            # No picture can be taken from there (e.g. on a summit): the error
+            # increases away from the barycenter of the area (the origin) and
+            # from alpha = 0.5, so that the search heads back into the area.
+            offset = np.array((z[0], z[1], z[2] - 0.5))
+            return error + offset @ offset, 2 * offset
+        return error, gradient
+
+    # Minimize error function from each initial position, keep the best
+    best = None
+    try:
+        for init in inits:
+            if progress is not None:
+                progress.restart(init)
+            alpha = optimize_picture(tuple(init), summits, projections, "vectorized").alpha
+            res = minimize(
+                errorfun,
+                ((init[0] - center[0]) / scale, (init[1] - center[1]) / scale, alpha),
+                jac=True,
+                method="L-BFGS-B",
+                bounds=((None, None), (None, None), (0, 1)),
+                callback=_step_callback(None if precision is None else precision / scale)
+            )
+            if best is None or res.fun < best[0].fun:
+                best = (res, init)
+    finally:
+        if path is not None:
+            path.array()[:] = np.multiply(path.array(), scale) + center
+    res, init = best
+    res.x = np.array((center[0] + res.x[0] * scale, center[1] + res.x[1] * scale))
+    return res, init
+
+
+def _fit_least_squares(summits, projections, init, path, progress=None, precision=None):
+    """
+    Fit (x, y, alpha, rho) to the projections of the summits with least_squares,
+    from the position 'init' (see photographer_residuals).
+    The (normalized) positions evaluated are appended to path (a PathRecorder,
+    or None), and reported to progress (a SearchProgress, or None) with the
+    error of their picture.
+    precision: if not None, the fit stops once an iteration moves the position
+    by less than it.
+    Return the result of least_squares, in normalized coordinates, with the
+    'center' and 'scale' of the normalization.
+    """
+    # The residuals are invariant by similarity: the fit runs on coordinates
+    # normalized on the summits, so that x, y, alpha and rho have similar scales.
+    center = barycenter(summits)
+    scale = max(distance(center, p) for p in summits) or 1
+    normalized = [((x - center[0]) / scale, (y - center[1]) / scale) for (x, y) in summits]
+    z = ((init[0] - center[0]) / scale, (init[1] - center[1]) / scale)
+    # Initial alpha and rho: the best ones for the initial position
+    alpha = optimize_picture(tuple(init), summits, projections, "vectorized").alpha
+    alpha = min(max(alpha, 1e-6), 1 - 1e-6)
+    residuals, jac = photographer_residuals((*z, alpha, 0), normalized, projections)
+    rho = -(jac[:, 3] @ residuals) / (jac[:, 3] @ jac[:, 3])
+    rho = rho if np.isfinite(rho) and rho > 1e-6 else 1
+
+    last = {}
+    def evaluate(params):
+        "Residuals and jacobian, computed once per position."
+        key = tuple(params)
+        if key not in last:
+            residuals, jac = photographer_residuals(params, normalized, projections)
+            # If a summit doesn't have any projection, use a large residual.
+            residuals = np.nan_to_num(residuals, nan=999999, posinf=999999, neginf=-999999)
+            jac = np.nan_to_num(jac, nan=0, posinf=0, neginf=0)
+            if path is not None:
+                path.append(params)
+            if progress is not None:
+                cost = residuals @ residuals / 2
+                error = None
+                if cost < progress.key:
+                    error, _ = picture_error_and_gradient(params[:2], params[2], normalized, projections)
+                progress.update((center[0] + params[0] * scale, center[1] + params[1] * scale), error, cost)
+            last.clear()
+            last[key] = (residuals, jac)
+        return last[key]
+
+    res = least_squares(
+        lambda params: evaluate(params)[0],
+        (*z, alpha, rho),
+        jac=lambda params: evaluate(params)[1],
+        bounds=((-np.inf, -np.inf, 0, 0), (np.inf, np.inf, 1, np.inf)),
+        method="trf",
+        callback=_step_callback(None if precision is None else precision / scale),
+    )
+    return res, center, scale, normalized
+
+
+def _find_photographer_least_squares(summits, projections, inits, path, progress, precision=None):
+    """
+    Fit the position of the photographer and of the picture in the least
+    squares sense from each initial position, return the best result with its
+    initial position.
+    The positions evaluated are appended to path (a PathRecorder, or None) and
+    reported to progress (a SearchProgress, or None).
+    precision: see _fit_least_squares.
+    """
+    # The normalization only depends on the summits: it is the same for all fits.
+    center = barycenter(summits)
+    scale = max(distance(center, p) for p in summits) or 1
+    best = None
+    try:
+        for init in inits:
+            if progress is not None:
+                progress.restart(init)
+            res, _, _, normalized = _fit_least_squares(summits, projections, init, path, progress, precision)
+            if best is None or res.cost < best[0].cost:
+                best = (res, init, normalized)
+    finally:
+        if path is not None:
+            path.array()[:] = np.multiply(path.array(), scale) + center
+    res, init, normalized = best
+    error, _ = picture_error_and_gradient(res.x[:2], res.x[2], normalized, projections)
+    res.fun = error
+    res.x = np.array((center[0] + res.x[0] * scale, center[1] + res.x[1] * scale))
+    return res, init
+
+
+def find_photographer(summits, projections, init=None, engine="slsqp", budget=1000, candidates=3,
+                      method="nested", record_path=False, path_maxlen=1024, path_decimation=1,
+                      callback=None, precision=None, max_evaluations=None, max_time=None):
     """
     Retrieve the position of the photographer.
     Input:
     - summits: list of (x, y) coordinates of the summits on the map
     - projections: distance of the projections of the summits from the left of the picture
-    - init: an optional initial position for the search 
+    - init: an optional initial position for the search, or "grid" to start
+      the search from the best positions found by grid_candidates
+    - engine: the solver used to position the picture (see optimize_picture)
+    - budget, candidates: the number of positions sampled by grid_candidates and
+      the number of best ones from which a search is run (when init is "grid")
+    - method: "nested" to search the position with Nelder-Mead, the picture
+      being positioned at each step (see optimize_picture), or "joint" to search
+      the position and alpha at once with L-BFGS-B (see picture_error_and_gradient),
+      or "least_squares" to fit the position, alpha and rho to the projections
+      (see photographer_residuals)
+    - record_path: True to record the positions evaluated by the search, at
+      most path_maxlen of them, one out of path_decimation (see PathRecorder)
+    - callback: an optional function called after each evaluation of the search
+      with the best position so far and its error: callback(photographer, error).
+      If it returns True, the search stops and returns this position.
+    - precision: the precision of the position (in the units of the summits,
+      e.g. meters), the searches stop once their steps are smaller
+    - max_evaluations: the maximum number of evaluations of the error by the
+      search (after the grid search), and max_time the maximum duration of the
+      computation (in seconds). Once reached, the search stops and returns the
+      best position so far (the initial one if none is evaluated yet). The
+      time is checked before the area is computed and before each search.
     Output:
     - The 'photographer' position
     - The 'error' at the photographer position
-    - The optimisation 'path'
+    - The optimisation 'path', an array (n, 2) of positions (None if not recorded)
     - The 'area' in which the photographer can be located
     - The 'init' point of the search
     """
@@ -146,54 +735,107 @@ def find_photographer(summits, projections, init=None):
         raise RuntimeError(
             "The projections and the summit must be in order from left to right."
         )
+    progress = None
+    if callback is not None or max_evaluations is not None or max_time is not None:
+        progress = SearchProgress(callback, max_evaluations, max_time)
+        if progress.deadline is not None and time.monotonic() >= progress.deadline:
+            raise RuntimeError(
+                "The time budget is exhausted before the search is started. "
+                "Increase max_time."
+            )
     # If no initial position, take the barycenter of the possible of the are
     # where the photographer can be.
     area = photographer_area(summits)
+    simplexes = [None]
     if init is None:
-        init = barycenter(area)
-
-    path = []
-    def errorfun(position):
-        "Error function to minimize."
-        error = optimize_picture(tuple(position), summits, projections).error
-        path.append(position)
-        return error
+        inits = [barycenter(area)]
+    elif isinstance(init, str):
+        if init != "grid":
+            raise RuntimeError("Unknown init: {}".format(init))
+        deadline = None if progress is None else progress.deadline
+        inits, (dx, dy) = grid_candidates(summits, projections, area, budget, candidates=candidates,
+                                          deadline=deadline)
+        # The searches start with a simplex the size of a cell of the grid.
+        simplexes = [[p, (p[0] + dx, p[1]), (p[0], p[1] + dy)] for p in inits]
+        if not inits:
+            inits, simplexes = [barycenter(area)], [None]
+    else:
+        inits = [init]
 
-    # Minimize error function
-    res = minimize(
-        errorfun,
-        init,
-        method="Nelder-Mead"
-    )
+    if method not in ("nested", "joint", "least_squares"):
+        raise RuntimeError("Unknown method: {}".format(method))
+    path = PathRecorder(path_maxlen, path_decimation) if record_path else None
+    try:
+        with stage("search"):
+            if method == "nested":
+                res, init = _find_photographer_nested(summits, projections, inits, simplexes, engine, path,
+                                                      progress, precision)
+            elif method == "joint":
+                res, init = _find_photographer_joint(summits, projections, inits, area, path, progress, precision)
+            else:
+                res, init = _find_photographer_least_squares(summits, projections, inits, path, progress, precision)
+        photographer, error = res.x, res.fun
+    except SearchStopped:
+        if progress.photographer is None:
+            # Stopped before the first evaluation (e.g. the time is up once the
+            # area is computed): return the initial position, with the error
+            # of its picture positioned by the fast engine.
+            init = inits[0]
+            photographer = np.array(init, dtype=float)
+            error = optimize_picture(tuple(init), summits, projections, "vectorized").error
+        else:
+            photographer, error, init = np.array(progress.photographer), progress.error, progress.init
 
-    return PhotographerPosition(photographer=res.x,
-                                error=res.fun, 
-                                path=path, 
+    return PhotographerPosition(photographer=photographer,
+                                error=error, 
+                                path=None if path is None else path.array(), 
                                 area=area, 
                                 init=init)
 
 
-def find_photographer_wsg84(latlngs, projections, init=None):
+def latlng_callback(conv, callback):
+    """
+    Return the callback of a search in (x, y) coordinates that calls callback
+    (see find_photographer) with the best positions in lat&lng, converted once
+    each with conv (a Converter).
+    """
+    last = {}
+    def utmcallback(photographer, error):
+        if photographer not in last:
+            last.clear()
+            last[photographer] = conv.to_latlng(*photographer, strict=False)
+        return callback(last[photographer], error)
+    return utmcallback
+
+
+def find_photographer_wsg84(latlngs, projections, init=None, mode="utm", **options):
     """
     Wrapper of find_photographer that uses latlngs in input & output
     instead of x,y coordinates.
+    mode: the (x, y) coordinates used by the optimizer (see Converter).
+    The options are passed to find_photographer.
     """
     # Convert input from latlng to xy (i.e. WSG84 to UTM).
-    conv = Converter(*latlngs[0])
-    utmsummits = [conv.from_latlng(*p) for p in latlngs]
-    utminit = None
-    if init is not None:
+    conv = Converter(*latlngs[0], mode=mode)
+    utmsummits = [tuple(p) for p in conv.from_latlng_batch(latlngs).tolist()]
+    utminit = init
+    if init is not None and not isinstance(init, str):
         utminit = conv.from_latlng(*init)
+    if options.get("callback") is not None:
+        options["callback"] = latlng_callback(conv, options["callback"])
 
     # Run the optimizer to find the photographer.
     utmphotographer, error, utmpath, utmarea, utminit = find_photographer(
-        utmsummits, projections, utminit
+        utmsummits, projections, utminit, **options
     ) 
 
     # Convert output from xy to latlng (i.e. UTM to WSG84).
     photographer = conv.to_latlng(*utmphotographer, strict=False)
-    path = [conv.to_latlng(*p, strict=False) for p in utmpath]
-    area = [conv.to_latlng(*p) for p in utmarea]
+    path = None
+    if utmpath is not None:
+        path = conv.to_latlng_batch(utmpath, strict=False)
+    # The area may stretch far away from the summits (i.e. out of their zone).
+    area = [tuple(p) for p in conv.to_latlng_batch(utmarea, strict=False).tolist()]
     init = conv.to_latlng(*utminit)
 
     return PhotographerPosition(photographer=photographer,
@@ -201,3 +843,89 @@ def find_photographer_wsg84(latlngs, projections, init=None):
                                 path=path, 
                                 area=area, 
                                 init=init)
+
+
+PhotographerFit = namedtuple('PhotographerFit', ["photographer", "alpha", "rho", "error", "residuals", "covariance"])
+
+
+@profiled("fit")
+def fit_photographer(summits, projections, photographer=None, sigma=None, **options):
+    """
+    Fit the position of the photographer and of the picture to the projections
+    of the summits, in the least squares sense (see photographer_residuals).
+    Input:
+    - summits: list of (x, y) coordinates of the summits on the map
+    - projections: distance of the projections of the summits from the left of the picture
+    - photographer: the initial position of the fit, the position found by
+      find_photographer (with the options) if None
+    - sigma: the standard deviation of the errors on the projections, estimated
+      from the residuals if None (this requires more than 5 summits)
+    Output:
+    - The 'photographer' position, and the 'alpha' and 'rho' of the picture
+    - The 'error' at the photographer position (see optimize_picture)
+    - The 'residuals' of the projections of the summits (in the units of the projections)
+    - The 'covariance' (4, 4) of (x, y, alpha, rho), None if sigma cannot be estimated
+    """
+    if photographer is None:
+        photographer = find_photographer(summits, projections, **options).photographer
+    res, center, scale, normalized = _fit_least_squares(summits, projections, photographer, None)
+    x, y, alpha, rho = res.x
+    error, _ = picture_error_and_gradient((x, y), alpha, normalized, projections)
+    width = projections[-1] - projections[0]
+    # The first residual is null by construction: it is not a degree of freedom.
+    freedom = len(summits) - 1 - 4
+    if sigma is not None:
+        sigma = sigma / width
+    elif freedom > 0:
+        sigma = sqrt(2 * res.cost / freedom)
+    covariance = None
+    if sigma is not None:
+        # Covariance of the normalized parameters, then of the actual ones.
+        covariance = sigma ** 2 * np.linalg.pinv(res.jac.T @ res.jac)
+        scaling = np.diag([scale, scale, 1, 1 / scale])
+        covariance = scaling @ covariance @ scaling
+    return PhotographerFit(photographer=(center[0] + x * scale, center[1] + y * scale),
+                           alpha=alpha,
+                           rho=rho / scale,
+                           error=error,
+                           residuals=res.fun * width,
+                           covariance=covariance)
+
+
+def fit_photographer_wsg84(latlngs, projections, photographer=None, sigma=None, mode="utm", **options):
+    """
+    Wrapper of fit_photographer that uses latlngs in input & output
+    instead of x,y coordinates. The covariance is in meters.
+    mode: the (x, y) coordinates used by the optimizer (see Converter).
+    The options are passed to find_photographer.
+    """
+    conv = Converter(*latlngs[0], mode=mode)
+    utmsummits = [tuple(p) for p in conv.from_latlng_batch(latlngs).tolist()]
+    utmphotographer = None
+    if photographer is not None:
+        utmphotographer = conv.from_latlng(*photographer)
+    init = options.get("init")
+    if init is not None and not isinstance(init, str):
+        options["init"] = conv.from_latlng(*init)
+    fit = fit_photographer(utmsummits, projections, utmphotographer, sigma, **options)
+    return fit._replace(photographer=conv.to_latlng(*fit.photographer, strict=False))
+
+
+Ellipse = namedtuple('Ellipse', ["semi_major", "semi_minor", "azimuth"])
+
+
+def uncertainty_ellipse(covariance, confidence=0.95):
+    """
+    Return the ellipse that contains the photographer with the given
+    confidence, from the covariance of its position (see fit_photographer):
+    - the length of its semi major and semi minor axes
+    - the azimuth of its major axis, in degrees clockwise from the y axis
+      (i.e. the north for UTM coordinates)
+    """
+    values, vectors = np.linalg.eigh(np.asarray(covariance, dtype=float)[:2, :2])
+    # Quantile of the chi-squared distribution with 2 degrees of freedom
+    k = sqrt(-2 * log(1 - confidence))
+    major = vectors[:, 1]
+    return Ellipse(semi_major=k * sqrt(max(values[1], 0)),
+                   semi_minor=k * sqrt(max(values[0], 0)),
+                   azimuth=degrees(atan2(major[0], major[1])) % 180)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""
+Opt-in instrumentation of the stages of a solve (the area of the photographer,
+the search, the positioning of the picture, the conversions...).
+The stages are only measured within a Profile, e.g.:
+    with Profile() as profile:
+        find_photographer_wsg84(latlngs, projections)
+    print(profile.breakdown())
+Outside of a Profile, an instrumented stage costs a lookup of a context variable.
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from math import inf
+
+_profile = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    """
+    The number of calls and the time spent in each stage of the computations
+    run within the profile (a context manager). The time of a stage includes
+    the time of the stages it runs (e.g. the search includes the positioning of
+    the picture), a stage run within itself is only counted once.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.seconds = {}
+        self.running = set()
+
+    def __enter__(self):
+        self.token = _profile.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _profile.reset(self.token)
+
+    def add(self, name, seconds, calls=1):
+        """Record calls of the stage name that took seconds."""
+        self.calls[name] = self.calls.get(name, 0) + calls
+        self.seconds[name] = self.seconds.get(name, 0) + seconds
+
+    def breakdown(self):
+        """Return the dict {stage: {'calls', 'seconds'}} of the stages run."""
+        return {name: {"calls": self.calls[name], "seconds": self.seconds[name]} for name in self.calls}
+
+
+class _Stage:
+    """The context manager of a stage, measured in the current profile."""
+
+    __slots__ = ("name", "profile", "start")
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+
+    def __enter__(self):
+        self.profile.running.add(self.name)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, time.perf_counter() - self.start)
+        self.profile.running.discard(self.name)
+
+
+class _Untimed:
+    """The context manager of a stage that is not measured."""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_UNTIMED = _Untimed()
+
+
+def stage(name):
+    """Return a context manager measuring the stage name in the current profile, if any."""
+    profile = _profile.get()
+    if profile is None or name in profile.running:
+        return _UNTIMED
+    return _Stage(name, profile)
+
+
+def count(name, calls=1):
+    """Record calls of the untimed stage name in the current profile, if any."""
+    profile = _profile.get()
+    if profile is not None:
+        profile.add(name, 0, calls)
+
+
+def profiled(name):
+    """Decorator measuring the calls of a function as the stage name (see stage)."""
+    def decorator(fun):
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            if _profile.get() is None:
+                return fun(*args, **kwargs)
+            with stage(name):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# The upper bounds of the buckets of the histograms of the time (in seconds)
+# and of the number of calls of a stage by solve.
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, inf)
+CALLS_BUCKETS = (1, 10, 100, 1000, 10000, inf)
+
+
+class StageMetrics:
+    """
+    Histograms of the time and of the number of calls of each stage, by solve,
+    aggregated from the breakdowns of the profiles (see observe), in the text
+    format of Prometheus (see exposition).
+    """
+
+    def __init__(self, prefix="photographer_stage"):
+        self.prefix = prefix
+        # For each stage and metric ("seconds" or "calls"): the counts of the buckets and the sum.
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, breakdown):
+        """Add the breakdown of a profile to the histograms."""
+        with self.lock:
+            for name, stage in breakdown.items():
+                histograms = self.histograms.setdefault(name, {
+                    "seconds": {"counts": [0] * len(SECONDS_BUCKETS), "sum": 0},
+                    "calls": {"counts": [0] * len(CALLS_BUCKETS), "sum": 0},
+                })
+                for metric, buckets in (("seconds", SECONDS_BUCKETS), ("calls", CALLS_BUCKETS)):
+                    histogram = histograms[metric]
+                    for i, bound in enumerate(buckets):
+                        if stage[metric] <= bound:
+                            histogram["counts"][i] += 1
+                    histogram["sum"] += stage[metric]
+
+    def exposition(self):
+        """Return the histograms in the text format of Prometheus."""
+        lines = []
+        helps = {"seconds": "Time spent in each stage of a solve, in seconds.",
+                 "calls": "Number of calls of each stage by solve."}
+        with self.lock:
+            for metric, buckets in (("seconds", SECONDS_BUCKETS), ("calls", CALLS_BUCKETS)):
+                name = "{}_{}".format(self.prefix, metric)
+                lines += ["# HELP {} {}".format(name, helps[metric]), "# TYPE {} histogram".format(name)]
+                for stage, histograms in sorted(self.histograms.items()):
+                    histogram = histograms[metric]
+                    for bound, count in zip(buckets, histogram["counts"]):
+                        le = "+Inf" if bound == inf else "{:g}".format(bound)
+                        lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, stage, le, count))
+                    lines.append('{}_sum{{stage="{}"}} {}'.format(name, stage, histogram["sum"]))
+                    lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, histogram["counts"][-1]))
+        return "\n".join(lines) + "\n"
+
+
+class EvaluationCounter(Profile):
+    """
+    A profile counting the evaluations of the error of a picture (i.e. for a
+    position of the photographer and a value of alpha) by the optimizer.
+    """
+
+    @property
+    def count(self):
+        return self.calls.get("evaluation", 0)
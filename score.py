@@ -2,83 +2,287 @@
 
 """
 Compute a score for all the examples in data that comes with a known location of the photographer.
+Each case is solved with one or several configurations of the optimizer (in
+parallel), and its error (in meters), time and number of evaluations of the
+error are recorded. The results can be saved in json or csv, compared to the
+ones of a baseline to flag the regressions, and added to the README.
 """
 
+import argparse
+import ast
+import csv
+import hashlib
 import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import utm
 
-from map import Map
+from profiling import EvaluationCounter
 from tools import distance
 from optimizer import find_photographer_wsg84
 
+# The sources whose changes invalidate the results in cache.
+SOURCES = ["optimizer.py", "tools.py", "converter.py", "profiling.py"]
 
-def score(display=False):
+FIELDS = ["configuration", "case", "summits", "noise", "mislabeled", "error", "time", "evaluations", "status"]
+
+
+def cases(data="data"):
+    """Return the list of the (name, info) of the examples with the location of their photographer."""
+    examples = []
+    for infojson in sorted(Path(data).glob("*/info.json")):
+        with infojson.open() as infofile:
+            info = json.load(infofile)
+        if "photographer_latlng" in info:
+            examples.append((infojson.parent.name, info))
+    return examples
+
+
+def parse_configuration(spec):
     """
-    Run all example, display result and compute a globla score.
+    Return the options of the optimizer of a configuration "key=value,key=value"
+    (the literals, e.g. numbers, None or False, are parsed, the other values are strings).
     """
+    options = {}
+    for item in filter(None, spec.split(",")):
+        if "=" not in item:
+            raise RuntimeError("Invalid configuration: {}".format(spec))
+        key, _, value = item.partition("=")
+        key, value = key.strip(), value.strip()
+        try:
+            options[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            options[key] = value
+    return options
 
-    num = 0
-    total_distance = 0
-    
-    if display:
-        print("-- Cases --")
 
-    # For each example that comes with all needed data
-    data = Path("data")
-    for example in data.iterdir():
+def run_case(name, info, configuration, options):
+    """
+    Solve a case with the options of the optimizer (see find_photographer_wsg84).
+    Return its result: the number of summits (and for a synthetic case, the
+    noise and the number of mislabeled summits), the error on the location of
+    the photographer (in meters), the time of the computation (in seconds), the
+    number of evaluations of the error, and the status ("ok" or the error raised).
+    """
+    synthetic = info.get("synthetic", {})
+    result = {"configuration": configuration, "case": name, "summits": len(info["latlngs"]),
+              "noise": synthetic.get("noise"), "mislabeled": len(synthetic.get("mislabeled", [])) if synthetic else None,
+              "error": None, "time": None, "evaluations": None, "status": "ok"}
+    # The error is measured in the UTM zone of the real photographer.
+    real_latlng = info["photographer_latlng"]
+    real_easting, real_northing, zone_number, zone_letter = utm.from_latlon(*real_latlng)
+    start = time.perf_counter()
+    try:
+        with EvaluationCounter() as counter:
+            computed_latlng = find_photographer_wsg84(
+                info["latlngs"], [i[0] for i in info["projections"]], **options
+            ).photographer
+    except RuntimeError as e:
+        result["status"] = str(e)
+        return result
+    result["time"] = time.perf_counter() - start
+    result["evaluations"] = counter.count
+    computed_easting, computed_northing, _, _ = utm.from_latlon(
+        *computed_latlng, force_zone_letter=zone_letter, force_zone_number=zone_number
+    )
+    result["error"] = int(distance((real_easting, real_northing), (computed_easting, computed_northing)))
+    return result
 
-        infojson = example.joinpath('info.json')
-        if not infojson.exists():
-            continue
 
-        try:
+def _run_task(task):
+    """Run a task (name, info, configuration, options) of the pool."""
+    return run_case(*task)
 
-            with infojson.open() as infofile:
-                info = json.load(infofile)
-
-                if 'photographer_latlng' not in info:
-                    continue
-
-                if display:
-                    print(" - ", example.name, end=": ")
-                    
-                # retrieve real photographer location
-                real_latlng = info['photographer_latlng']
-                real_easting, real_northing, zone_number, zone_letter = utm.from_latlon(*real_latlng)
-
-                # compute photographer location
-                computed_latlng = find_photographer_wsg84(
-                    info['latlngs'],
-                    [i[0] for i in info['projections']]
-                ).photographer
-                computed_easting, computed_northing, _, _ = utm.from_latlon(
-                    *computed_latlng,
-                    force_zone_letter=zone_letter,
-                    force_zone_number=zone_number
-                )
-
-                delta = int(distance((real_easting, real_northing), (computed_easting, computed_northing)))
-                if display:
-                    print(delta, "meters")
-
-                num += 1
-                total_distance += delta
-
-        except RuntimeError as e:
-            if display:
-                print(e)
+
+def cache_key(info, options):
+    """Return the key of the result of a case, that changes with the case, the options or the sources."""
+    h = hashlib.sha256()
+    for source in SOURCES:
+        h.update(Path(source).read_bytes())
+    h.update(json.dumps([info, options], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def score(configurations=None, workers=None, cache=None, display=False, data="data"):
+    """
+    Run all the cases of data (see synthetic.py for more cases) with each
+    configuration (a dict name: options of the optimizer, see find_photographer),
+    on 'workers' processes (all the CPUs by default, 1 to measure the times
+    without contention).
+    cache: the path of a json file where the results are kept, and reused
+    while the cases, the options and the sources of the optimizer don't change.
+    Return the list of the results of the cases (see run_case).
+    """
+    configurations = configurations or {"default": {}}
+    stored = {}
+    if cache is not None and Path(cache).exists():
+        with open(cache) as f:
+            stored = json.load(f)
+    examples = cases(data)
+    tasks, keys, results = [], [], {}
+    for configuration, options in configurations.items():
+        for name, info in examples:
+            key = cache_key(info, options)
+            if key in stored:
+                results[(configuration, name)] = dict(stored[key], configuration=configuration)
             else:
-                raise
+                tasks.append((name, info, configuration, options))
+                keys.append(key)
+    workers = workers or os.cpu_count() or 1
+    # The processes of the pool are only started by pool.map, with several workers.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        computed = map(_run_task, tasks) if workers == 1 else pool.map(_run_task, tasks)
+        for key, result in zip(keys, computed):
+            results[(result["configuration"], result["case"])] = result
+            stored[key] = result
+            if display:
+                print(" - {} {}: {}".format(result["configuration"], result["case"], _describe(result)))
+    if cache is not None:
+        with open(cache, "w") as f:
+            json.dump(stored, f)
+    # The results in the order of the configurations and the cases.
+    return [results[(configuration, name)] for configuration in configurations for name, _ in examples]
 
-    score = int(total_distance / num)
 
-    print("-- Summary --")
-    print(num, "cases")
-    print("Average error:", score, "meters")
+def _describe(result):
+    """Describe the result of a case in a line."""
+    if result["status"] != "ok":
+        return result["status"]
+    return "{} meters, {:.3f} s, {} evaluations".format(result["error"], result["time"], result["evaluations"])
+
+
+def summarize(results):
+    """
+    Return the summary of the results of each configuration: the number of
+    'cases' solved, their 'average_error' (in meters), total 'time' and
+    'evaluations', and the number of 'failures'.
+    """
+    summary = {}
+    for result in results:
+        s = summary.setdefault(result["configuration"],
+                               {"cases": 0, "average_error": 0, "time": 0, "evaluations": 0, "failures": 0})
+        if result["status"] != "ok":
+            s["failures"] += 1
+            continue
+        s["cases"] += 1
+        s["average_error"] += result["error"]
+        s["time"] += result["time"]
+        s["evaluations"] += result["evaluations"]
+    for s in summary.values():
+        s["average_error"] = int(s["average_error"] / s["cases"]) if s["cases"] else None
+    return summary
+
+
+def compare(results, baseline, error_tolerance=0.05, time_tolerance=1.5):
+    """
+    Compare the results to the ones of a baseline, return the list of the
+    regressions: a case that fails, a case whose error grows by more than
+    error_tolerance (relative, plus 1 meter), or whose time grows by more than
+    time_tolerance times (plus 10 ms).
+    """
+    reference = {(r["configuration"], r["case"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get((result["configuration"], result["case"]))
+        if base is None or base["status"] != "ok":
+            continue
+        name = "{} {}".format(result["configuration"], result["case"])
+        if result["status"] != "ok":
+            regressions.append("{}: fails ({})".format(name, result["status"]))
+            continue
+        if result["error"] > base["error"] * (1 + error_tolerance) + 1:
+            regressions.append("{}: error {} meters instead of {}".format(name, result["error"], base["error"]))
+        if result["time"] > base["time"] * time_tolerance + 0.01:
+            regressions.append("{}: time {:.3f} s instead of {:.3f}".format(name, result["time"], base["time"]))
+    return regressions
+
+
+def save_json(path, configurations, results):
+    """Save the configurations, the results and their summary in json."""
+    with open(path, "w") as f:
+        json.dump({"configurations": configurations, "results": results, "summary": summarize(results)}, f, indent=2)
+
+
+def save_csv(path, results):
+    """Save the results in csv, one line per case and configuration."""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def readme_section(title, results, description=""):
+    """Return the section of the score of the results (of one configuration) in the README."""
+    lines = ["### {}".format(title), ""]
+    if description:
+        lines += [description, ""]
+    lines += ["-- Cases --", ""]
+    lines += ["- {}: {}".format(r["case"], "{} meters".format(r["error"]) if r["status"] == "ok" else r["status"])
+              for r in results]
+    (summary,) = summarize(results).values()
+    lines += ["", "-- Summary --", "", "{} cases".format(summary["cases"]),
+              "Average error: {} meters".format(summary["average_error"]),
+              "Time: {:.2f} seconds".format(summary["time"]), "", ""]
+    return "\n".join(lines)
+
+
+def update_readme(section, path="README.md"):
+    """Add a section at the top of the "Score evolution" of the README."""
+    readme = Path(path).read_text()
+    heading = "## Score evolution\n\n"
+    if heading not in readme:
+        raise RuntimeError("No 'Score evolution' in {}".format(path))
+    Path(path).write_text(readme.replace(heading, heading + section, 1))
 
 
 if __name__ == '__main__':
-    score(display=True)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="utm", help="'local' to optimize on the plane tangent to the earth")
+    parser.add_argument("--method", default="nested", help="'joint' to search the position and the picture at once")
+    parser.add_argument("--engine", default="slsqp", help="solver used to position the picture")
+    parser.add_argument("--init", default=None, help="'grid' to seed the search with a grid search")
+    parser.add_argument("--budget", type=int, default=1000, help="positions sampled by the grid search")
+    parser.add_argument("--candidates", type=int, default=3, help="searches run from the grid search")
+    parser.add_argument("--data", default="data", help="the directory of the cases (see synthetic.py)")
+    parser.add_argument("--config", action="append", default=[],
+                        help="a configuration 'key=value,...' overriding the options above (repeat to compare)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes running the cases (all the CPUs by default, 1 for reliable times)")
+    parser.add_argument("--cache", default=None, help="json file caching the results of the unchanged cases")
+    parser.add_argument("--json", default=None, help="save the results in this json file")
+    parser.add_argument("--csv", default=None, help="save the results in this csv file")
+    parser.add_argument("--baseline", default=None, help="json file of results to compare to")
+    parser.add_argument("--error-tolerance", type=float, default=0.05, help="relative growth of an error that is a regression")
+    parser.add_argument("--time-tolerance", type=float, default=1.5, help="growth factor of a time that is a regression")
+    parser.add_argument("--readme", default=None, metavar="TITLE",
+                        help="add the score (of the first configuration) to the README with this title")
+    parser.add_argument("--description", default="", help="the description of the score added to the README")
+    args = parser.parse_args()
 
+    base = {key: getattr(args, key) for key in ("mode", "method", "engine", "init", "budget", "candidates")}
+    configurations = {spec or "default": {**base, **parse_configuration(spec)} for spec in args.config or [""]}
+    print("-- Cases --")
+    results = score(configurations, args.workers, args.cache, display=True, data=args.data)
+    print("-- Summary --")
+    for configuration, s in summarize(results).items():
+        print("{}: {} cases, average error: {} meters, time: {:.2f} seconds, {} evaluations, {} failures".format(
+            configuration, s["cases"], s["average_error"], s["time"], s["evaluations"], s["failures"]))
+    if args.json:
+        save_json(args.json, configurations, results)
+    if args.csv:
+        save_csv(args.csv, results)
+    if args.readme:
+        first = next(iter(configurations))
+        update_readme(readme_section(args.readme, [r for r in results if r["configuration"] == first], args.description))
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.error_tolerance, args.time_tolerance)
+        print("-- Regressions --")
+        for regression in regressions:
+            print(regression)
+        print("{} regressions".format(len(regressions)))
+        sys.exit(1 if regressions else 0)
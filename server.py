@@ -8,19 +8,32 @@ or
     uvicorn server:app --reload
 """
 
+import asyncio
+import multiprocessing
 import os
 import json
-import PIL
+import queue
+import time
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel, Field, ValidationError, model_validator
 
-from optimizer import find_photographer_wsg84
+from assets import AssetStore
+from cache import LocateCache, SqliteLocateCache
+from catalog import ExampleCatalog, RenderedFile
+from metaoptimizer import find_photographer_multistart_wsg84
+from optimizer import find_photographer_wsg84, fit_photographer_wsg84, uncertainty_ellipse
+from profiling import Profile, StageMetrics, stage
 
 
 def _load_dotenv(path=".env"):
@@ -39,52 +52,582 @@ def _load_dotenv(path=".env"):
 
 _load_dotenv()
 
-app = FastAPI()
+# The solves are CPU bound: they run in a pool of processes so that they never
+# block the event loop. At most LOCATE_QUEUE_SIZE solves are running or waiting
+# for a worker, further requests are rejected with a 503.
+# The workers are started by a fork server, as forking the server (that runs
+# threads) could deadlock them. They don't share the globals of the server.
+WORKERS_CONTEXT = multiprocessing.get_context("forkserver")
+WORKERS_CONTEXT.set_forkserver_preload(["server"])
+LOCATE_WORKERS = int(os.environ.get("LOCATE_WORKERS", os.cpu_count() or 1))
+LOCATE_QUEUE_SIZE = int(os.environ.get("LOCATE_QUEUE_SIZE", 4 * LOCATE_WORKERS))
+LOCATE_TIMEOUT = float(os.environ.get("LOCATE_TIMEOUT", 30))
+# Maximum number of queries of a /locate/batch solved at the same time.
+LOCATE_BATCH_CONCURRENCY = int(os.environ.get("LOCATE_BATCH_CONCURRENCY", LOCATE_WORKERS))
+# Minimum duration between two progress events of /locate/stream, in seconds.
+LOCATE_PROGRESS_INTERVAL = float(os.environ.get("LOCATE_PROGRESS_INTERVAL", 0.1))
+
+# Results of /locate/ are cached, in memory or in a sqlite database if
+# LOCATE_CACHE_PATH is set. LOCATE_CACHE_SIZE=0 disables the cache.
+LOCATE_CACHE_PATH = os.environ.get("LOCATE_CACHE_PATH")
+LOCATE_CACHE_SIZE = int(os.environ.get("LOCATE_CACHE_SIZE", 1024))
+LOCATE_CACHE_TTL = float(os.environ.get("LOCATE_CACHE_TTL", 24 * 3600))
+LOCATE_CACHE_DIGITS = int(os.environ.get("LOCATE_CACHE_DIGITS", 6))
+LOCATE_CACHE_PROJECTION_DIGITS = int(os.environ.get("LOCATE_CACHE_PROJECTION_DIGITS", 1))
+
+# The uncertainty on the location is computed from the standard deviation of
+# the errors on the projections (in pixels), estimated from the residuals if
+# LOCATE_SIGMA is not set (this requires at least 6 summits).
+LOCATE_SIGMA = float(os.environ["LOCATE_SIGMA"]) if os.environ.get("LOCATE_SIGMA") else None
+LOCATE_CONFIDENCE = float(os.environ.get("LOCATE_CONFIDENCE", 0.95))
+
+# With LOCATE_ALTERNATIVES > 0, the photographer is searched from many positions
+# of its area (its corners, its barycenter and LOCATE_MULTISTART_SAMPLES positions
+# spread over it, see find_photographer_multistart), and the replies of /locate/
+# list at most LOCATE_ALTERNATIVES other local minima of the error.
+LOCATE_ALTERNATIVES = int(os.environ.get("LOCATE_ALTERNATIVES", 0))
+LOCATE_MULTISTART_SAMPLES = int(os.environ.get("LOCATE_MULTISTART_SAMPLES", 8))
+
+# With LOCATE_PROFILE=1, the time and the calls of each stage of the solves are
+# measured: their breakdown is added to the replies of /locate/, and their
+# histograms are served by /metrics (see Profile).
+LOCATE_PROFILE = os.environ.get("LOCATE_PROFILE", "0").lower() in ("1", "true", "yes")
+metrics = StageMetrics()
+
+# The examples are kept in memory (see ExampleCatalog), and clients may reuse
+# them for EXAMPLES_MAX_AGE seconds before revalidating them with their ETag.
+EXAMPLES_MAX_AGE = int(os.environ.get("EXAMPLES_MAX_AGE", 300))
+# The thumbnails, previews and tiles of the pictures of the examples are
+# generated on demand in ASSETS_PATH (see AssetStore).
+ASSETS_PATH = os.environ.get("ASSETS_PATH", ".assets")
+assets = AssetStore(ASSETS_PATH)
+examples = ExampleCatalog("data", assets)
+
+if LOCATE_CACHE_PATH:
+    cache = SqliteLocateCache(
+        LOCATE_CACHE_PATH, LOCATE_CACHE_SIZE, LOCATE_CACHE_TTL, LOCATE_CACHE_DIGITS, LOCATE_CACHE_PROJECTION_DIGITS
+    )
+else:
+    cache = LocateCache(LOCATE_CACHE_SIZE, LOCATE_CACHE_TTL, LOCATE_CACHE_DIGITS, LOCATE_CACHE_PROJECTION_DIGITS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Start the pool of solvers and build the catalogs with the server, stop the
+    pool and close the cache on shutdown.
+    """
+    app.state.pool = ProcessPoolExecutor(max_workers=LOCATE_WORKERS, mp_context=WORKERS_CONTEXT)
+    app.state.slots = asyncio.Semaphore(LOCATE_QUEUE_SIZE)
+    # The manager shares the progress queues and the cancel events with the pool.
+    app.state.manager = WORKERS_CONTEXT.Manager()
+    # The catalogs are built at startup, out of the event loop.
+    await asyncio.to_thread(examples.load)
+    await asyncio.to_thread(index_page.get)
+    yield
+    app.state.pool.shutdown(wait=True, cancel_futures=True)
+    app.state.manager.shutdown()
+    cache.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def submit(fun, *args, wait=False, **kwargs):
+    """
+    Submit fun(*args, **kwargs) to the pool of solvers, return an asyncio future
+    of its result. If too many solves are pending, wait for a slot if wait is
+    True, raise a 503 otherwise.
+    """
+    if not wait and app.state.slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many requests in progress, retry later.",
+            headers={"Retry-After": "1"},
+        )
+    await app.state.slots.acquire()
+    loop = asyncio.get_running_loop()
+    try:
+        future = app.state.pool.submit(partial(fun, *args, **kwargs))
+    except BaseException:
+        app.state.slots.release()
+        raise
+    # A solve keeps its slot until its worker is done with it, even on timeout.
+    future.add_done_callback(lambda f: loop.call_soon_threadsafe(app.state.slots.release))
+    return asyncio.wrap_future(future)
+
+
+async def solve(fun, *args, wait=False, **kwargs):
+    """
+    Run fun(*args, **kwargs) in the pool of solvers and return its result.
+    Raise a 504 on timeout. wait: see submit.
+    """
+    future = await submit(fun, *args, wait=wait, **kwargs)
+    try:
+        return await asyncio.wait_for(future, LOCATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The computation took too long.")
+
+
+class ProgressReporter:
+    """
+    Callback of find_photographer_wsg84, run in a worker: put the best position
+    and its error in 'progress' (a queue) at most every 'interval' seconds, and
+    stop the search once 'cancel' (an event) is set.
+    """
+
+    def __init__(self, progress, cancel, interval=LOCATE_PROGRESS_INTERVAL):
+        self.progress = progress
+        self.cancel = cancel
+        self.interval = interval
+        self.next = 0
+        self.sent = None
+
+    def __call__(self, photographer, error):
+        now = time.monotonic()
+        if now < self.next:
+            return False
+        self.next = now + self.interval
+        if self.sent != (photographer, error):
+            self.sent = (photographer, error)
+            self.progress.put({"location": [float(x) for x in photographer], "error": float(error)})
+        return self.cancel.is_set()
+
+
+LocateSettings = namedtuple("LocateSettings", ["sigma", "confidence", "alternatives", "samples", "profile"])
+
+def locate_settings():
+    """
+    Return the settings of the server that shape the replies of /locate/
+    (LOCATE_SIGMA, LOCATE_CONFIDENCE, LOCATE_ALTERNATIVES,
+    LOCATE_MULTISTART_SAMPLES and LOCATE_PROFILE), to pass to the workers.
+    """
+    return LocateSettings(sigma=LOCATE_SIGMA,
+                          confidence=LOCATE_CONFIDENCE,
+                          alternatives=LOCATE_ALTERNATIVES,
+                          samples=LOCATE_MULTISTART_SAMPLES,
+                          profile=LOCATE_PROFILE)
+
+
+def locate_photographer(latlngs, projections, callback=None, settings=None, **options):
+    """
+    Locate the photographer, then fit the position of the photographer and of
+    the picture to the projections, from this location. Return the reply of
+    /locate/: the fitted location, its error, the residuals of the projections
+    and the uncertainty on the location. If the time left of the max_time of
+    the options after the search is shorter than an evaluation of the error,
+    the location of the search is replied as is, without residuals nor
+    uncertainty.
+    callback and options: see find_photographer.
+    settings: the settings of the server (see locate_settings), read from its
+    globals if None.
+    If LOCATE_ALTERNATIVES is set, the reply lists the 'alternatives' locations
+    (other local minima of the error, with their error), from the best.
+    If LOCATE_PROFILE is set, the reply has the 'profile' of the solve: the
+    'calls' and the 'seconds' of each of its stages.
+    The reply tells if the search is 'stopped' by its max_evaluations or
+    max_time (or by callback) before it converges.
+    """
+    settings = settings or locate_settings()
+    if not settings.profile:
+        return _locate_photographer(latlngs, projections, callback, settings, **options)
+    with Profile() as profile, stage("solve"):
+        reply = _locate_photographer(latlngs, projections, callback, settings, **options)
+    reply["profile"] = profile.breakdown()
+    return reply
+
+
+def _locate_photographer(latlngs, projections, callback, settings, **options):
+    """Locate the photographer, see locate_photographer."""
+    start = time.monotonic()
+    max_time, max_evaluations = options.get("max_time"), options.get("max_evaluations")
+    evaluations, interrupted = 0, False
+    if max_time is not None or max_evaluations is not None:
+        # Count the evaluations of the search, to tell if it is stopped by its
+        # budget and if the fit has time to run.
+        def counted(photographer, error, callback=callback):
+            nonlocal evaluations, interrupted
+            evaluations += 1
+            interrupted = callback is not None and bool(callback(photographer, error))
+            return interrupted
+        callback = counted
+    alternatives = []
+    try:
+        if settings.alternatives > 0:
+            # The searches run one after the other: the pool already runs the solves in parallel.
+            optimisation = find_photographer_multistart_wsg84(
+                latlngs, projections, samples=settings.samples, workers=1, callback=callback, **options
+            )
+            alternatives = [{"location": [float(x) for x in m["photographer"]], "error": m["error"]}
+                            for m in optimisation.minima[1:settings.alternatives + 1]]
+        else:
+            optimisation = find_photographer_wsg84(latlngs, projections, callback=callback, **options)
+    except RuntimeError as e:
+        if max_time is None or time.monotonic() - start < max_time:
+            raise
+        # The time is up before the search (see find_photographer).
+        return {"status": str(e), "stopped": True}
+    elapsed = time.monotonic() - start
+    # The location of a search stopped by its budget may be improved with more time.
+    stopped = (interrupted
+               or (max_evaluations is not None and evaluations >= max_evaluations)
+               or (max_time is not None and elapsed >= max_time))
+    # The time of an evaluation is overestimated with the one of the area and of the conversions.
+    if max_time is not None and max_time - elapsed < elapsed / max(evaluations, 1):
+        # The time left is shorter than an evaluation: reply the location of
+        # the search, without the fit.
+        return {
+            "location": [float(x) for x in optimisation.photographer],
+            "error": float(optimisation.error),
+            "residuals": [],
+            "uncertainty": None,
+            "alternatives": alternatives,
+            "stopped": stopped,
+            "status": "ok",
+        }
+    fit = fit_photographer_wsg84(latlngs, projections, optimisation.photographer, settings.sigma)
+    uncertainty = None
+    if fit.covariance is not None:
+        ellipse = uncertainty_ellipse(fit.covariance, settings.confidence)
+        uncertainty = {
+            "semi_major": float(ellipse.semi_major),
+            "semi_minor": float(ellipse.semi_minor),
+            "azimuth": float(ellipse.azimuth),
+            "confidence": settings.confidence,
+        }
+    # The location, its residuals and its uncertainty are the ones of the fit,
+    # a local refinement of the location found by the search.
+    return {
+        "location": [float(x) for x in fit.photographer],
+        "error": float(fit.error),
+        "residuals": [float(r) for r in fit.residuals],
+        "uncertainty": uncertainty,
+        "alternatives": alternatives,
+        "stopped": stopped,
+        "status": "ok",
+    }
 
 
 class Locate(BaseModel):
     projections: List[Tuple[float, float]] = []
     latlngs: List[Tuple[float, float]] = []
+    # Options of the search (see find_photographer): the precision of the
+    # location (in meters), and its budget in evaluations of the error and in
+    # seconds, after which the best location so far is replied.
+    precision: Optional[float] = Field(None, gt=0)
+    max_evaluations: Optional[int] = Field(None, gt=0)
+    max_time: Optional[float] = Field(None, gt=0)
+
+    @model_validator(mode="after")
+    def check_summits(self):
+        """The photographer is located from at least 3 summits, with their projections."""
+        if len(self.latlngs) != len(self.projections):
+            raise ValueError("There must be as many projections as latlngs.")
+        if len(self.latlngs) < 3:
+            raise ValueError("At least 3 summits are required.")
+        return self
+
+    def options(self):
+        """Return the options of the search that are set."""
+        return self.model_dump(include={"precision", "max_evaluations", "max_time"}, exclude_none=True)
+
+class BatchLocate(Locate):
+    id: Optional[Union[int, str]] = None
+
+def locate_key(latlngs, projections, **options):
+    """
+    Return the key of the reply of /locate/ in the cache: the inputs, the
+    options of the search and the settings of the server that shape the reply.
+    """
+    return cache.key(latlngs, projections, sigma=LOCATE_SIGMA, confidence=LOCATE_CONFIDENCE,
+                     alternatives=LOCATE_ALTERNATIVES, samples=LOCATE_MULTISTART_SAMPLES, **options)
+
+def cache_reply(key, reply):
+    """
+    Save the reply of a solve in the cache, without its profile: the profile
+    is only replied (and added to the metrics) for the solve that measured it.
+    The reply of a search stopped by its budget is not saved: the same query
+    may get a better location on a less loaded server.
+    Return the reply.
+    """
+    profile = reply.pop("profile", None)
+    if not reply.get("stopped"):
+        cache.set(key, reply)
+    if profile is None:
+        return reply
+    metrics.observe(profile)
+    return dict(reply, profile=profile)
+
+async def locate_reply(latlngs, projections, wait=False, **options):
+    """
+    Return the reply of /locate/, from the cache or computed by the pool of solvers.
+    The options are passed to the search (see locate_photographer).
+    wait: True to wait for the pool if too many solves are pending (see submit).
+    """
+    key = locate_key(latlngs, projections, **options)
+    reply = cache.get(key)
+    if reply is None:
+        try:
+            reply = await solve(locate_photographer, latlngs, projections, wait=wait, settings=locate_settings(),
+                                **options)
+        except RuntimeError as e:
+            reply = {"status": str(e)}
+        reply = cache_reply(key, reply)
+    return reply
 
 @app.post("/locate/")
 async def locate(query: Locate):
     """API entry point to locate the photographer."""
     projections = [p[0] for p in query.projections]
-    try:
-        optimisation = find_photographer_wsg84(query.latlngs, projections)
-        reply = {"location": optimisation.photographer, "error": optimisation.error, "status": "ok"}
-    except RuntimeError as e:
-        reply = {"status": str(e)}
+    reply = await locate_reply(query.latlngs, projections, **query.options())
     print("locate request {} => {}".format(query, reply))
     return reply
- 
+
+class BatchResponse(StreamingResponse):
+    """
+    The replies of a batch, streamed while its queries are still received.
+    Until 'received' (an event) is set, the request reads the messages of the
+    client: only then the response listens for its disconnection.
+    """
+
+    def __init__(self, content, received, **kwargs):
+        super().__init__(content, **kwargs)
+        self.received = received
+
+    async def listen_for_disconnect(self, receive):
+        await self.received.wait()
+        await super().listen_for_disconnect(receive)
+
+@app.post("/locate/batch")
+async def locate_batch(request: Request):
+    """
+    API entry point to locate the photographers of a batch of pictures.
+    The queries of /locate/ (with an optional 'id') are either a json list, or
+    NDJSON (one query per line, with the content type application/x-ndjson)
+    that are solved as soon as they are received.
+    The replies of /locate/ are streamed as NDJSON, in the order they are
+    computed, with the 'index' of their query in the batch and its 'id'. A
+    query that cannot be solved only has an error status. The queries wait
+    for the pool of solvers rather than failing when it is busy.
+    """
+    semaphore = asyncio.Semaphore(LOCATE_BATCH_CONCURRENCY)
+    replies = asyncio.Queue()
+
+    async def locate_item(index, item):
+        reply = {"index": index}
+        try:
+            if isinstance(item, bytes):
+                item = json.loads(item)
+            query = BatchLocate.model_validate(item)
+        except (ValueError, ValidationError) as e:
+            reply["status"] = "Invalid query: {}".format(e)
+            return reply
+        if query.id is not None:
+            reply["id"] = query.id
+        async with semaphore:
+            try:
+                reply.update(await locate_reply(query.latlngs, [p[0] for p in query.projections], wait=True,
+                                                **query.options()))
+            except HTTPException as e:
+                reply["status"] = e.detail
+        return reply
+
+    async def run(index, item):
+        # Every query gets a reply, even if it fails unexpectedly.
+        reply = {"index": index, "status": "Internal error."}
+        try:
+            reply = await locate_item(index, item)
+        except Exception as e:
+            reply["status"] = "Internal error: {}".format(e)
+        finally:
+            await replies.put(reply)
+
+    tasks = []
+    # Set once all the queries are received, when None is put in the replies.
+    received = asyncio.Event()
+
+    def start(item):
+        tasks.append(asyncio.create_task(run(len(tasks), item)))
+
+    def end():
+        print("locate batch of {} queries".format(len(tasks)))
+        received.set()
+        replies.put_nowait(None)
+
+    async def receive_ndjson():
+        buffer = b""
+        try:
+            async for chunk in request.stream():
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        start(line)
+            if buffer.strip():
+                start(buffer)
+        except ClientDisconnect:
+            pass
+        finally:
+            end()
+
+    readers = []
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        # The queries are read while the replies are streamed.
+        readers.append(asyncio.create_task(receive_ndjson()))
+    else:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            raise HTTPException(status_code=422, detail="The batch must be a json list of queries, or NDJSON.")
+        for item in items:
+            start(item)
+        end()
+
+    async def stream():
+        try:
+            done, sent = False, 0
+            while not done or sent < len(tasks):
+                reply = await replies.get()
+                if reply is None:
+                    done = True
+                else:
+                    sent += 1
+                    yield json.dumps(reply) + "\n"
+        finally:
+            # The client is gone: stop the queries that are not solved yet.
+            for task in readers + tasks:
+                task.cancel()
+
+    return BatchResponse(stream(), received, media_type="application/x-ndjson")
+
+def server_sent_event(event, data):
+    """Format a server-sent event with json data."""
+    return "event: {}\ndata: {}\n\n".format(event, json.dumps(data))
+
+@app.post("/locate/stream")
+async def locate_stream(query: Locate):
+    """
+    API entry point to locate the photographer, with the progress of the search.
+    Stream server-sent events: 'progress' events with the best location so far
+    and its error, then a 'result' event with the reply of /locate/.
+    If the client disconnects or the computation takes too long, the search is
+    stopped and its worker freed.
+    """
+    projections = [p[0] for p in query.projections]
+    key = locate_key(query.latlngs, projections, **query.options())
+    reply = cache.get(key)
+    if reply is not None:
+        return StreamingResponse(iter([server_sent_event("result", reply)]), media_type="text/event-stream")
+    progress, cancel = app.state.manager.Queue(), app.state.manager.Event()
+    future = await submit(locate_photographer, query.latlngs, projections, callback=ProgressReporter(progress, cancel),
+                    settings=locate_settings(), **query.options())
+
+    async def events():
+        deadline = asyncio.get_running_loop().time() + LOCATE_TIMEOUT
+        try:
+            while True:
+                await asyncio.wait({future}, timeout=LOCATE_PROGRESS_INTERVAL)
+                while True:
+                    try:
+                        yield server_sent_event("progress", progress.get_nowait())
+                    except queue.Empty:
+                        break
+                if future.done():
+                    break
+                if asyncio.get_running_loop().time() > deadline:
+                    yield server_sent_event("result", {"status": "The computation took too long."})
+                    return
+            try:
+                reply = future.result()
+            except Exception as e:
+                reply = {"status": str(e) or "Internal error."}
+            reply = cache_reply(key, reply)
+            print("locate stream {} => {}".format(query, reply))
+            yield server_sent_event("result", reply)
+        finally:
+            # Stop the search if nobody waits for it anymore.
+            if not future.done():
+                cancel.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/cache/")
+async def cache_stats():
+    """API entry point to get the counters of the cache of /locate/."""
+    return cache.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    API entry point to get the histograms of the time and of the number of
+    calls of the stages of the solves, in the text format of Prometheus.
+    They are only measured if LOCATE_PROFILE is set.
+    """
+    return Response(metrics.exposition(), media_type="text/plain; version=0.0.4")
+
+def cached_response(request, content, etag, media_type, max_age=0):
+    """
+    Return content with its ETag, or a 304 if the client already has it.
+    Clients may reuse it for max_age seconds, then revalidate it.
+    """
+    headers = {"ETag": etag, "Cache-Control": "public, max-age={}".format(max_age)}
+    if etag in request.headers.get("if-none-match", "").replace(" ", "").split(","):
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type=media_type, headers=headers)
+
 @app.get("/examples/")
-async def list_examples():
+async def list_examples(request: Request):
     """API entry point to get the list of examples."""
-    return [p.name for p in Path("./data").iterdir()
-            if p.joinpath("info.json").exists()]
+    content, etag = await asyncio.to_thread(examples.list)
+    return cached_response(request, content, etag, "application/json", EXAMPLES_MAX_AGE)
 
 @app.get("/examples/{name}")
-async def get_example(name: str):
+async def get_example(name: str, request: Request):
     """API entry point to get data of a given example."""
-    dir = Path("./data") / name
-    with dir.joinpath("info.json").open() as info:
-        data = json.load(info)
-        with PIL.Image.open(dir / data["picture"]) as img:
-            data["picture_size"] = img.size    
-        data["picture"] = dir / data["picture"]
-        return data
+    try:
+        content, etag = await asyncio.to_thread(examples.get, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown example: {}".format(name))
+    return cached_response(request, content, etag, "application/json", EXAMPLES_MAX_AGE)
 
-@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
-@app.api_route("/index.html", methods=["GET", "HEAD"], response_class=HTMLResponse)
-async def index():
-    """Serve index.html with the Google Maps API key injected from the
-    environment, so the key never lives in the source tree."""
-    html = Path("static/index.html").read_text()
+@app.get("/assets/{hash}/{asset:path}")
+async def get_asset(hash: str, asset: str):
+    """
+    API entry point to get an asset of the picture of an example (see
+    AssetStore), at the url given by /examples/{name}. As the url holds the
+    hash of the picture, the asset never changes.
+    """
+    try:
+        path, media_type = await asyncio.to_thread(assets.get, hash, asset)
+    except KeyError:
+        # The picture may not be registered yet (e.g. the server restarted).
+        await asyncio.to_thread(examples.load)
+        try:
+            path, media_type = await asyncio.to_thread(assets.get, hash, asset)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Unknown asset: {}/{}".format(hash, asset))
+    return FileResponse(path, media_type=media_type,
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+def render_index(html):
+    """Inject the Google Maps API key from the environment in index.html, so
+    the key never lives in the source tree."""
     api_key = os.environ.get("GOOGLE_MAPS_API_KEY", "")
     if not api_key:
         print("WARNING: GOOGLE_MAPS_API_KEY is not set; the map will not load.")
     return html.replace("{{GOOGLE_MAPS_API_KEY}}", api_key)
 
+index_page = RenderedFile("static/index.html", render_index)
+
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+@app.api_route("/index.html", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def index(request: Request):
+    """Serve index.html, rendered once (see render_index). It is revalidated on
+    each load, so that a new version is served as soon as it is deployed."""
+    content, etag = await asyncio.to_thread(index_page.get)
+    return cached_response(request, content, etag, "text/html")
+
 app.mount("/data", StaticFiles(directory="data"), name="data")
 app.mount("/", StaticFiles(directory="static"), name="static")
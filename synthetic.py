@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Generate synthetic cases to measure how the optimizer scales: a photographer
+and N summits are placed at random, the summits are projected on a picture
+(see compute_projection_on_picture), and noise and mislabeled summits can be
+added. The cases are written like the examples of data (info.json and a blank
+picture), e.g. to be scored with:
+    python synthetic.py synthetic --sizes 5 10 50 100 --noise 0 2
+    python score.py --data synthetic --csv synthetic.csv
+"""
+
+import argparse
+import json
+import random
+from math import cos, pi, radians, sin
+from pathlib import Path
+
+import PIL.Image
+
+from converter import Converter
+from optimizer import compute_projection_on_picture
+from tools import distance
+
+
+def generate_case(n, noise=0, mislabeled=0, seed=None, center=(45.9, 6.87), fov=60,
+                  distances=(1000, 20000), width=4000, height=3000):
+    """
+    Return the info (as in the info.json of the examples) of a synthetic case.
+    Input:
+    - n: the number of summits
+    - noise: the standard deviation of the noise added to the projections (in pixels)
+    - mislabeled: the number of summits moved to a random position, as if the
+      wrong summit was picked on the map (between its neighbours, so that the
+      summits stay in order from left to right)
+    - seed: the seed of the random generator
+    - center: the (lat, lng) of the photographer
+    - fov: the field of view of the picture (in degrees)
+    - distances: the range of the distances of the summits to the photographer (in meters)
+    - width, height: the size of the picture (in pixels)
+    Output: the info, with the 'projections' of the summits on the picture (in
+    pixels, from left to right), their 'latlngs', the 'photographer_latlng' and
+    the parameters of the case in 'synthetic'.
+    """
+    if n < 3:
+        raise RuntimeError("A case requires at least 3 summits.")
+    rand = random.Random(seed)
+    conv = Converter(*center, mode="local")
+    heading = rand.uniform(0, 2 * pi)
+    half = radians(fov) / 2
+
+    def summit(low=-half, high=half):
+        "A random summit in the field of view, between two angles: its angle and its position."
+        angle = heading + rand.uniform(low, high)
+        d = rand.uniform(*distances)
+        return angle, (d * cos(angle), d * sin(angle))
+
+    # The summits from left to right, i.e. by decreasing angle.
+    angles, summits = zip(*sorted((summit() for _ in range(n)), reverse=True))
+    summits = list(summits)
+    alpha = rand.uniform(0.2, 0.8)
+    rho = rand.uniform(0.01, 0.1)
+    projected = compute_projection_on_picture((0, 0), summits, alpha, rho)
+    # The pixels of the projections, with a margin of 5% on the sides.
+    scale = 0.9 * width / distance(projected[0], projected[-1])
+    xs = [0.05 * width + scale * distance(projected[0], p) + rand.gauss(0, noise) for p in projected]
+    # The summits keep their order: the noise can't swap two of them.
+    xs = sorted(xs)
+    ys = [height / 3 + rand.gauss(0, height / 50) for _ in xs]
+    # Mislabeled summits are replaced by random ones, between their neighbours.
+    wrong = sorted(rand.sample(range(n), min(mislabeled, n)))
+    bounds = [heading + half] + list(angles) + [heading - half]
+    for i in wrong:
+        summits[i] = summit(bounds[i + 2] - heading, bounds[i] - heading)[1]
+    latlngs = conv.to_latlng_batch(summits).tolist()
+    return {
+        "projections": [[x, y] for x, y in zip(xs, ys)],
+        "latlngs": latlngs,
+        "photographer_latlng": list(center),
+        "picture": "photo.png",
+        "picture_size": [width, height],
+        "synthetic": {
+            "summits": n, "noise": noise, "mislabeled": wrong, "seed": seed,
+            "alpha": alpha, "rho": rho, "heading": heading,
+        },
+    }
+
+
+def write_case(directory, info):
+    """Write the info.json and the (blank) picture of a case in directory."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with directory.joinpath("info.json").open("w") as f:
+        json.dump(info, f, indent=4)
+    PIL.Image.new("RGB", tuple(info["picture_size"]), (200, 200, 200)).save(directory / info["picture"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="the directory of the cases")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 20, 50, 100, 200], help="numbers of summits")
+    parser.add_argument("--noise", type=float, nargs="+", default=[0], help="noise on the projections (pixels)")
+    parser.add_argument("--mislabeled", type=int, nargs="+", default=[0], help="numbers of mislabeled summits")
+    parser.add_argument("--seeds", type=int, default=1, help="cases generated for each set of parameters")
+    args = parser.parse_args()
+    for n in args.sizes:
+        for noise in args.noise:
+            for mislabeled in args.mislabeled:
+                for seed in range(args.seeds):
+                    name = "n{}-noise{:g}-mislabeled{}-seed{}".format(n, noise, mislabeled, seed)
+                    write_case(Path(args.directory) / name, generate_case(n, noise, mislabeled, seed))
+                    print(name)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import PIL.Image
+
+import assets
+
+
+class TestAssetStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.picture = Path(self.tmp.name) / "photo.png"
+        PIL.Image.new("RGB", (600, 300), "red").save(self.picture)
+        self.store = assets.AssetStore(Path(self.tmp.name) / "assets", thumbnail_size=100, preview_size=400)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def size_of(self, hash, asset):
+        path, _ = self.store.get(hash, asset)
+        with PIL.Image.open(path) as img:
+            return img.size
+
+    def test_manifest(self):
+        manifest = self.store.manifest(self.picture, (600, 300), prefix="assets/")
+        hash = self.store.register(self.picture)
+        self.assertEqual(manifest["preview"], "assets/{}/preview.webp".format(hash))
+        self.assertEqual(manifest["tiles"], "assets/{}/tiles/{{level}}/{{column}}_{{row}}.webp".format(hash))
+        self.assertEqual(manifest["levels"], 3)
+        # The hash only depends on the content of the picture
+        copy = Path(self.tmp.name) / "copy.png"
+        copy.write_bytes(self.picture.read_bytes())
+        self.assertEqual(self.store.register(copy), hash)
+
+    def test_resized(self):
+        hash = self.store.register(self.picture)
+        self.assertEqual(self.size_of(hash, "thumbnail.jpg"), (100, 50))
+        self.assertEqual(self.size_of(hash, "preview.webp"), (400, 200))
+        path, media_type = self.store.get(hash, "preview.webp")
+        self.assertEqual(media_type, "image/webp")
+        self.assertEqual(self.store.get(hash, "preview.webp"), (path, media_type))
+
+    def test_tiles(self):
+        hash = self.store.register(self.picture)
+        self.assertEqual(self.size_of(hash, "tiles/0/0_0.jpg"), (150, 75))
+        self.assertEqual(self.size_of(hash, "tiles/1/1_0.jpg"), (44, 150))
+        self.assertEqual(self.size_of(hash, "tiles/2/2_1.webp"), (88, 44))
+        for asset in ("tiles/2/3_0.jpg", "tiles/3/0_0.jpg", "tiles/0/0_0.png", "../photo.png"):
+            with self.assertRaises(KeyError):
+                self.store.get(hash, asset)
+        with self.assertRaises(KeyError):
+            self.store.get("0123456789abcdef", "thumbnail.jpg")
+
+    def test_prepare(self):
+        hash = self.store.prepare(self.picture)
+        files = [p for p in (self.store.directory / hash).rglob("*") if p.is_file()]
+        # Thumbnail, preview, and 1 + 2 + 6 tiles, in 2 formats
+        self.assertEqual(len(files), 2 * (2 + 1 + 2 + 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
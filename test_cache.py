@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import time
+import unittest
+
+import cache
+
+
+class TestLocateCache(unittest.TestCase):
+
+    def make_cache(self, **kwargs):
+        c = cache.LocateCache(**kwargs)
+        self.addCleanup(c.close)
+        return c
+
+    def test_key(self):
+        c = self.make_cache(digits=4, projection_digits=0)
+        key = c.key([(45.12341, 6.1), (45.2, 6.2)], [10.2, 20.4])
+        self.assertEqual(key, c.key([(45.12344, 6.10001), (45.2, 6.2)], [10.4, 20.1]))
+        self.assertNotEqual(key, c.key([(45.1236, 6.1), (45.2, 6.2)], [10.2, 20.4]))
+        self.assertNotEqual(key, c.key([(45.12341, 6.1), (45.2, 6.2)], [10.2, 21.4]))
+        self.assertNotEqual(key, c.key([(45.12341, 6.1), (45.2, 6.2)], [10.2, 20.4], init="grid"))
+
+    def test_hits_and_misses(self):
+        c = self.make_cache()
+        self.assertIsNone(c.get("a"))
+        c.set("a", {"status": "ok"})
+        self.assertEqual(c.get("a"), {"status": "ok"})
+        stats = c.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_lru(self):
+        c = self.make_cache(size=2)
+        c.set("a", 1)
+        c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        self.assertEqual(len(c), 2)
+        self.assertEqual(c.get("a"), 1)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(c.get("c"), 3)
+
+    def test_ttl(self):
+        c = self.make_cache(ttl=0.05)
+        c.set("a", 1)
+        self.assertEqual(c.get("a"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(c.get("a"))
+
+    def test_disabled(self):
+        c = self.make_cache(size=0)
+        c.set("a", 1)
+        self.assertIsNone(c.get("a"))
+
+
+class TestSqliteLocateCache(TestLocateCache):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_cache(self, **kwargs):
+        c = cache.SqliteLocateCache(self.path, **kwargs)
+        self.addCleanup(c.close)
+        return c
+
+    def test_persistence(self):
+        with cache.SqliteLocateCache(self.path) as c:
+            c.set("a", {"location": [45.9, 6.8]})
+        self.assertEqual(self.make_cache().get("a"), {"location": [45.9, 6.8]})
+
+
+if __name__ == "__main__":
+    unittest.main()
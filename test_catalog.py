@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import PIL.Image
+
+import catalog
+
+
+def touch(path, delta):
+    """Shift the modification time of path by delta seconds."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + int(delta * 1e9)))
+
+
+class TestExampleCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.add_example("b", (40, 30))
+        self.add_example("a", (20, 10))
+        self.directory.joinpath("empty").mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def add_example(self, name, size):
+        dir = self.directory / name
+        dir.mkdir()
+        PIL.Image.new("RGB", size).save(dir / "photo.png")
+        with dir.joinpath("info.json").open("w") as f:
+            json.dump({"picture": "photo.png", "projections": [], "latlngs": []}, f)
+
+    def test_list(self):
+        examples = catalog.ExampleCatalog(self.directory)
+        content, etag = examples.list()
+        self.assertEqual(json.loads(content), ["a", "b"])
+        self.assertEqual(examples.list(), (content, etag))
+        self.add_example("c", (10, 10))
+        touch(self.directory, 1)
+        content, other = examples.list()
+        self.assertEqual(json.loads(content), ["a", "b", "c"])
+        self.assertNotEqual(etag, other)
+
+    def test_get(self):
+        examples = catalog.ExampleCatalog(self.directory)
+        content, etag = examples.get("b")
+        data = json.loads(content)
+        self.assertEqual(data["picture_size"], [40, 30])
+        self.assertEqual(data["picture"], str(self.directory / "b" / "photo.png"))
+        self.assertEqual(examples.get("b"), (content, etag))
+        with self.assertRaises(KeyError):
+            examples.get("empty")
+        with self.assertRaises(KeyError):
+            examples.get("..")
+
+    def test_invalidation(self):
+        examples = catalog.ExampleCatalog(self.directory)
+        _, etag = examples.get("a")
+        PIL.Image.new("RGB", (50, 60)).save(self.directory / "a" / "photo.png")
+        touch(self.directory / "a" / "photo.png", 1)
+        content, other = examples.get("a")
+        self.assertEqual(json.loads(content)["picture_size"], [50, 60])
+        self.assertNotEqual(etag, other)
+
+    def test_load(self):
+        examples = catalog.ExampleCatalog(self.directory)
+        examples.load()
+        self.assertEqual(sorted(examples.entries), ["a", "b"])
+
+
+class TestRenderedFile(unittest.TestCase):
+
+    def test_render(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "index.html"
+            path.write_text("key={{KEY}}")
+            page = catalog.RenderedFile(path, lambda text: text.replace("{{KEY}}", "abc"))
+            content, etag = page.get()
+            self.assertEqual(content, b"key=abc")
+            self.assertEqual(page.get(), (content, etag))
+            path.write_text("KEY={{KEY}}")
+            touch(path, 1)
+            self.assertEqual(page.get()[0], b"KEY=abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
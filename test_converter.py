@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from converter import Converter
+from tools import distance
+
+
+class TestConverter(unittest.TestCase):
+
+    latlngs = [(45.9169134, 7.0246497), (45.8999213, 7.0040026), (45.8874995, 7.0069444),
+               (45.8688259, 6.9879852), (45.8622473, 6.9518381)]
+
+    def test_batch(self):
+        conv = Converter(*self.latlngs[0])
+        points = conv.from_latlng_batch(self.latlngs)
+        self.assertEqual(points.shape, (5, 2))
+        for latlng, p in zip(self.latlngs, points):
+            self.assertEqual(tuple(p), conv.from_latlng(*latlng))
+        latlngs = conv.to_latlng_batch(points)
+        for latlng, p in zip(latlngs, points):
+            self.assertEqual(tuple(latlng), conv.to_latlng(*p))
+
+    def test_local(self):
+        conv = Converter(*self.latlngs[0], mode="local")
+        points = conv.from_latlng_batch(self.latlngs)
+        self.assertEqual(tuple(points[0]), (0, 0))
+        self.assertEqual(conv.from_latlng(*self.latlngs[1]), tuple(points[1]))
+        # The second summit is south west of the first one
+        self.assertLess(points[1][0], 0)
+        self.assertLess(points[1][1], 0)
+        np.testing.assert_allclose(conv.to_latlng_batch(points), self.latlngs, rtol=0, atol=1e-10)
+        # Same distances as UTM (up to its scale factor)
+        utm = Converter(*self.latlngs[0]).from_latlng_batch(self.latlngs)
+        for p, q in zip(points[1:], utm[1:]):
+            self.assertAlmostEqual(distance(points[0], p) / distance(utm[0], q), 1, 3)
+
+    def test_errors(self):
+        with self.assertRaises(RuntimeError):
+            Converter(*self.latlngs[0], mode="foo")
+        conv = Converter(*self.latlngs[0], mode="local")
+        with self.assertRaises(RuntimeError):
+            conv.to_latlng(1e7, 0)
+        self.assertTrue(np.isnan(conv.to_latlng_batch([(1e7, 0)], strict=False)).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
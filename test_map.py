@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+import map
+import tools
+
+
+class TestMap(unittest.TestCase):
+
+    summits = [(30, 40), (20, 25), (5, 30)]
+
+    def test_hot_colorize(self):
+        m = map.Map(dimensions=(4, 3))
+        m.hot_colorize(lambda p: p[0], incr=0)
+        pixels = np.asarray(m.map)
+        self.assertEqual(pixels.shape, (3, 4, 3))
+        for x in range(4):
+            self.assertEqual(tuple(pixels[1, x]), map.percentage_to_color(100 * x / 3)[:3])
+        # With the origin at the bottom, the pixel (x, y) is on the row 3 - y.
+        m = map.Map(dimensions=(4, 3), y_origin="bottom")
+        m.hot_colorize(lambda p: p[1], incr=0)
+        pixels = np.asarray(m.map)
+        self.assertEqual(tuple(pixels[0, 0]), (255, 255, 255))
+        self.assertEqual(tuple(pixels[1, 0]), (0, 0, 255))
+        self.assertEqual(tuple(pixels[2, 0]), (128, 128, 255))
+
+    def test_hot_colorize_without_errors(self):
+        # The pixels without an error are left as they are.
+        for tolerance in (None, 0.1):
+            m = map.Map(dimensions=(4, 3))
+            m.map.paste((255, 0, 0), (0, 0, 4, 3))
+            m.hot_colorize(lambda p: np.nan if p[0] == 0 else p[0], tolerance=tolerance)
+            pixels = np.asarray(m.map)
+            for y in range(3):
+                self.assertEqual(tuple(pixels[y, 0]), (255, 0, 0))
+                self.assertEqual(tuple(pixels[y, 1]), map.percentage_to_color(0)[:3])
+                self.assertEqual(tuple(pixels[y, 3]), map.percentage_to_color(100)[:3])
+
+    def test_grey_out_region(self):
+        for y_origin in ("top", "bottom"):
+            m = map.Map(dimensions=(40, 50), y_origin=y_origin)
+            m.grey_out_region(lambda p: not tools.is_valid_location(p, self.summits))
+            n = map.Map(dimensions=(40, 50), y_origin=y_origin)
+            n.grey_out_region(lambda points: ~tools.is_valid_location_batch(points, self.summits), vectorized=True)
+            self.assertTrue(np.array_equal(np.asarray(m.map), np.asarray(n.map)))
+            self.assertEqual(set(np.unique(np.asarray(m.map))), {235, 255})
+        # With the origin at the top, the pixel (x, y) greys out the row y - 1.
+        m = map.Map(dimensions=(3, 3))
+        m.grey_out_region(lambda p: p == (1, 2))
+        pixels = np.asarray(m.map)[:, :, 0]
+        self.assertEqual(pixels.tolist(), [[255, 255, 255], [255, 235, 255], [255, 255, 255]])
+
+    def test_adaptive_errors(self):
+        errorfun = lambda points: np.hypot(points[:, 0] - 70, points[:, 1] - 20)
+        xs, ys = np.meshgrid(range(100), range(61), indexing="ij")
+        exact = errorfun(np.stack((xs.ravel(), ys.ravel()), axis=-1)).reshape(100, 61)
+        matrix, count = map.adaptive_errors(errorfun, (100, 61), tolerance=0.1)
+        self.assertEqual(matrix.shape, (100, 61))
+        self.assertLess(count, exact.size / 2)
+        self.assertEqual(matrix[70, 20], 0)
+        self.assertLess(np.abs(matrix - exact).max(), 1)
+        # A discontinuity is followed down to the pixel
+        step = lambda points: (points[:, 0] > 30.5).astype(float)
+        matrix, count = map.adaptive_errors(step, (100, 61), tolerance=0.1)
+        np.testing.assert_allclose(matrix, step(np.stack((xs.ravel(), ys.ravel()), axis=-1)).reshape(100, 61))
+        matrix, count = map.adaptive_errors(errorfun, (1, 3))
+        self.assertEqual(count, 3)
+
+    def test_compute_color_matrix(self):
+        m = map.Map(dimensions=(40, 30))
+        colorfun = lambda p: (p[0] - 10) ** 2 + (p[1] - 20) ** 2
+        matrix, error_min, error_max = m.compute_color_matrix(colorfun, tolerance=0.05)
+        self.assertEqual(matrix.shape, (40, 30))
+        self.assertEqual((error_min, error_max), (0, 29 ** 2 + 20 ** 2))
+        self.assertIs(m.compute_color_matrix(colorfun, tolerance=0.05)[0], matrix)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest import mock
+
+import fixtures
+import metaoptimizer
+import optimizer
+import tools
+
+
+class TestFindPhotographerFor5(fixtures.SummitsTestCase):
+
+    summits = fixtures.SummitsTestCase.summits[:6]
+    projections = fixtures.SummitsTestCase.projections[:6]
+
+    def test_parallel(self):
+        calls = []
+        sequential = metaoptimizer.find_photographer_for_combinations(
+            self.summits, self.projections, workers=1, engine="vectorized"
+        )
+        parallel = metaoptimizer.find_photographer_for_combinations(
+            self.summits, self.projections, workers=2, chunksize=2, engine="vectorized",
+            progress=lambda done, total: calls.append((done, total))
+        )
+        self.assertEqual(calls, [(i, 6) for i in range(1, 7)])
+        self.assertEqual(len(parallel.details), 6)
+        self.assertEqual(
+            [d["combination"] for d in parallel.details],
+            [d["combination"] for d in sequential.details]
+        )
+        for p, s in zip(parallel.details, sequential.details):
+            self.assertEqual(tuple(p["photographer"]), tuple(s["photographer"]))
+        self.assertEqual(parallel.photographer, sequential.photographer)
+
+    def test_shards(self):
+        whole = metaoptimizer.find_photographer_for_combinations(
+            self.summits, self.projections, size=4, workers=1, engine="vectorized"
+        )
+        shards = [
+            metaoptimizer.find_photographer_for_combinations(
+                self.summits, self.projections, size=4, shard=(i, 2), workers=1, engine="vectorized"
+            )
+            for i in range(2)
+        ]
+        self.assertEqual(len(whole.details), 15)
+        self.assertEqual(
+            sorted(d["combination"] for s in shards for d in s.details),
+            [d["combination"] for d in whole.details]
+        )
+        done = [d["combination"] for d in shards[0].details]
+        rest = metaoptimizer.find_photographer_for_combinations(
+            self.summits, self.projections, size=4, skip=done, workers=1, engine="vectorized"
+        )
+        self.assertEqual(
+            [d["combination"] for d in rest.details],
+            [d["combination"] for d in shards[1].details]
+        )
+
+
+class TestStrategies(fixtures.SummitsTestCase):
+
+    def test_random(self):
+        res = metaoptimizer.find_photographer_for_combinations(
+            self.summits, self.projections, strategy="random", budget=5, workers=1, engine="vectorized"
+        )
+        self.assertEqual(len(res.details), 5)
+        self.assertEqual(len(set(tuple(d["combination"]) for d in res.details)), 5)
+
+    def test_ransac(self):
+        ref = optimizer.find_photographer(self.summits, self.projections, engine="vectorized")
+        # The fourth summit is mislabeled
+        summits = list(self.summits)
+        summits[3] = (summits[3][0] + 60, summits[3][1] + 40)
+        basic = optimizer.find_photographer(summits, self.projections, engine="vectorized")
+        res = metaoptimizer.find_photographer_for_combinations(
+            summits, self.projections, strategy="ransac", workers=1, warm_start=True, engine="vectorized"
+        )
+        best = max(res.details, key=lambda d: len(d["inliers"]))
+        self.assertNotIn(3, best["inliers"])
+        self.assertLess(tools.distance(res.photographer, ref.photographer), 50)
+        self.assertGreater(tools.distance(basic.photographer, ref.photographer), 200)
+
+    def test_multistart(self):
+        res = metaoptimizer.find_photographer_multistart(
+            self.summits, self.projections, samples=4, workers=1, engine="vectorized"
+        )
+        ref = optimizer.find_photographer(self.summits, self.projections, engine="vectorized")
+        self.assertLessEqual(res.error, ref.error + 1e-9)
+        self.assertEqual([m["error"] for m in res.minima], sorted(m["error"] for m in res.minima))
+        self.assertEqual(res.minima[0]["photographer"], res.photographer)
+        # The searches that converge to the same position are merged
+        self.assertEqual(sum(m["starts"] for m in res.minima), 1 + len(res.area) + 4)
+        for a, b in zip(res.minima, res.minima[1:]):
+            self.assertGreater(tools.distance(a["photographer"], b["photographer"]), 1)
+
+    def test_multistart_max_time(self):
+        res = metaoptimizer.find_photographer_multistart(
+            self.summits, self.projections, samples=4, workers=1, max_time=0.01, max_evaluations=3
+        )
+        self.assertLess(sum(m["starts"] for m in res.minima), 1 + len(res.area) + 4)
+        # No search is started: the error tells that the budget is exhausted
+        with self.assertRaisesRegex(RuntimeError, "time budget is exhausted"):
+            metaoptimizer.find_photographer_multistart(self.summits, self.projections, workers=1, max_time=0)
+        with self.assertRaisesRegex(RuntimeError, "time budget is exhausted"):
+            metaoptimizer.find_photographer_multistart(self.summits, self.projections, workers=2, max_time=0)
+
+    def test_multistart_inits(self):
+        area = [(1, 1), (0, 1), (0, 0), (1, 0)]
+        inits = metaoptimizer.multistart_inits(area, samples=5)
+        self.assertEqual(inits[0], (0.5, 0.5))
+        self.assertEqual(inits[1], (0.95, 0.95))
+        self.assertEqual(len(inits), 1 + 4 + 5)
+        self.assertTrue(tools.is_in_envelop_batch(inits, area).all())
+
+    def test_ransac_without_consensus(self):
+        # No summit is consistent with the combinations: the best one is kept
+        res = metaoptimizer.find_photographer_for_combinations(
+            self.summits, self.projections, strategy="ransac", budget=2, threshold=-1, workers=1,
+            engine="vectorized"
+        )
+        best = min(res.details, key=lambda d: d["error"])
+        self.assertEqual(res.error, best["error"])
+        self.assertEqual(tuple(res.photographer), tuple(best["photographer"]))
+
+    def test_exact_combination(self):
+        results = iter([((1, 2), 0.0), ((3, 4), 0.5)] + [((5, 6), 1.0)] * 19)
+        def find(summits, projections, init, **options):
+            photographer, error = next(results)
+            return optimizer.PhotographerPosition(photographer, error, None, None, init)
+        with mock.patch.object(metaoptimizer, "find_photographer_basic", find):
+            res = metaoptimizer.find_photographer_for_combinations(self.summits, self.projections, workers=1)
+        self.assertEqual(res.photographer, (1, 2))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(RuntimeError):
+            metaoptimizer.find_photographer_for_combinations(self.summits, self.projections, strategy="foo")
+
+
+if __name__ == "__main__":
+    unittest.main()
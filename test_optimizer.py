@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
+import time
 import unittest
-from math import fabs, sqrt
+from math import exp, fabs, sqrt
+from unittest import mock
 
+import fixtures
 import optimizer
+import tools
 
 
 class TestPositionPicture(unittest.TestCase):
@@ -48,5 +52,285 @@ class TestPositionPicture(unittest.TestCase):
         self.assertEqual(res.projections[2][1], 100)
 
 
+class TestVectorizedEngine(fixtures.SummitsTestCase):
+
+    cases = [
+        ((0, 0), [(-10, 10), (0, 10), (10, 10)], [-1, 0, 1]),
+        ((100, 100), [(100, 400), (400, 400), (300, 100)], [-75 * sqrt(2), 0, 75 * sqrt(2)]),
+        ((300, 300), [(553, 410), (560, 221), (488, 145), (424, 22), (298, 104)], [356, 450, 563, 659, 804]),
+    ]
+
+    def test_same_as_slsqp(self):
+        for photographer, summits, projections in self.cases:
+            ref = optimizer.optimize_picture(photographer, summits, projections)
+            res = optimizer.optimize_picture(photographer, summits, projections, engine="vectorized")
+            self.assertAlmostEqual(res.alpha, ref.alpha, 3)
+            self.assertAlmostEqual(res.error, ref.error, 6)
+            self.assertLessEqual(res.error, ref.error + 1e-9)
+            for p, q in zip(res.projections, ref.projections):
+                self.assertAlmostEqual(p[0], q[0], delta=1e-2 * max(1, abs(q[0])))
+                self.assertAlmostEqual(p[1], q[1], delta=1e-2 * max(1, abs(q[1])))
+
+    def test_error(self):
+        # photographer is on a summit!
+        res = optimizer.optimize_picture(
+            (300, 100),
+            [(100, 400), (400, 400), (300, 100)],
+            [-106.06601717798213, 0, 106.06601717798213],
+            engine="vectorized",
+        )
+        self.assertEqual(res.projections[2][0], 300)
+        self.assertEqual(res.projections[2][1], 100)
+
+    def test_find_photographer(self):
+        ref = optimizer.find_photographer(self.summits, self.projections)
+        res = optimizer.find_photographer(self.summits, self.projections, engine="vectorized")
+        self.assertLess(sqrt((res.photographer[0] - ref.photographer[0]) ** 2
+                             + (res.photographer[1] - ref.photographer[1]) ** 2), 1)
+
+    def test_batch(self):
+        summits, projections = self.summits[:5], self.projections[:5]
+        photographers = [[(300, 300), (100, 450)], [(50, 300), (400, 0)]]
+        alphas, errors = optimizer.optimize_picture_batch(photographers, summits, projections)
+        self.assertEqual(alphas.shape, (2, 2))
+        self.assertEqual(errors.shape, (2, 2))
+        for i in range(2):
+            for j in range(2):
+                res = optimizer.optimize_picture(photographers[i][j], summits, projections, engine="vectorized")
+                self.assertAlmostEqual(alphas[i, j], res.alpha, 7)
+                self.assertAlmostEqual(errors[i, j], res.error, 10)
+
+    def test_error_grid(self):
+        summits, projections = self.summits[:5], self.projections[:5]
+        grid = optimizer.error_grid(summits, projections, (0, 600, 0, 500), (7, 6))
+        self.assertEqual(grid.errors.shape, (7, 6))
+        self.assertEqual(list(grid.xs), [0, 100, 200, 300, 400, 500, 600])
+        self.assertEqual(list(grid.ys), [0, 100, 200, 300, 400, 500])
+        for i in (0, 3, 6):
+            for j in (1, 4):
+                res = optimizer.optimize_picture((grid.xs[i], grid.ys[j]), summits, projections, engine="vectorized")
+                self.assertAlmostEqual(grid.errors[i, j], res.error, 10)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(RuntimeError):
+            optimizer.optimize_picture((0, 0), [(-10, 10), (0, 10), (10, 10)], [-1, 0, 1], engine="foo")
+
+
+class TestGridInit(fixtures.SummitsTestCase):
+
+    def test_grid_candidates(self):
+        area = tools.photographer_area(self.summits)
+        candidates, cellsize = optimizer.grid_candidates(
+            self.summits, self.projections, area, budget=300, candidates=2
+        )
+        self.assertEqual(len(candidates), 2)
+        self.assertEqual(len(cellsize), 2)
+        errors = [optimizer.optimize_picture(p, self.summits, self.projections).error for p in candidates]
+        self.assertLessEqual(errors[0], errors[1] + 1e-9)
+        for p in candidates:
+            self.assertTrue(tools.is_valid_location(p, self.summits))
+
+    def test_grid_candidates_deadline(self):
+        area = tools.photographer_area(self.summits)
+        # Once the deadline is passed, only the first level is sampled.
+        self.assertEqual(
+            optimizer.grid_candidates(self.summits, self.projections, area, budget=300, deadline=0),
+            optimizer.grid_candidates(self.summits, self.projections, area, budget=100, levels=1),
+        )
+
+    def test_find_photographer(self):
+        ref = optimizer.find_photographer(self.summits, self.projections, record_path=True)
+        res = optimizer.find_photographer(self.summits, self.projections, init="grid", budget=300, candidates=1,
+                                          record_path=True)
+        self.assertLess(tools.distance(res.photographer, ref.photographer), 1)
+        self.assertLess(len(res.path), len(ref.path))
+
+    def test_unknown_init(self):
+        with self.assertRaises(RuntimeError):
+            optimizer.find_photographer(self.summits, self.projections, init="foo")
+
+
+class TestJointMethod(fixtures.SummitsTestCase):
+
+    def test_gradient(self):
+        h = 1e-6
+        for (x, y), alpha in zip([(300, 300), (100, 450), (400, 350)], [0.2, 0.5, 0.8]):
+            error, gradient = optimizer.picture_error_and_gradient((x, y), alpha, self.summits, self.projections)
+            _, ref = optimizer.optimize_picture_batch([(x, y)], self.summits, self.projections)
+            self.assertGreaterEqual(error, ref[0] - 1e-12)
+            for k, z in enumerate([(x + h, y, alpha), (x, y + h, alpha), (x, y, alpha + h)]):
+                e, _ = optimizer.picture_error_and_gradient(z[:2], z[2], self.summits, self.projections)
+                self.assertAlmostEqual(gradient[k], (e - error) / h, delta=1e-4 * max(1, abs(gradient[k])))
+
+    def test_find_photographer(self):
+        ref = optimizer.find_photographer(self.summits, self.projections, engine="vectorized", record_path=True)
+        res = optimizer.find_photographer(self.summits, self.projections, method="joint", record_path=True)
+        self.assertLess(tools.distance(res.photographer, ref.photographer), 1)
+        self.assertLessEqual(res.error, ref.error + 1e-9)
+        self.assertLess(len(res.path), len(ref.path))
+
+    def test_infeasible_init(self):
+        # No picture can be taken from a summit: the search leaves it
+        ref = optimizer.find_photographer(self.summits, self.projections, method="joint")
+        res = optimizer.find_photographer(self.summits, self.projections, method="joint", init=self.summits[3])
+        self.assertLess(tools.distance(res.photographer, ref.photographer), 1)
+
+    def test_unknown_method(self):
+        with self.assertRaises(RuntimeError):
+            optimizer.find_photographer(self.summits, self.projections, method="foo")
+
+
+class TestLeastSquares(fixtures.SummitsTestCase):
+
+    def test_jacobian(self):
+        h = 1e-6
+        for params in [(300, 300, 0.2, 1.5), (100, 450, 0.5, 0.8), (400, 350, 0.8, 2)]:
+            residuals, jac = optimizer.photographer_residuals(params, self.summits, self.projections)
+            self.assertEqual(jac.shape, (7, 4))
+            self.assertEqual(residuals[0], 0)
+            for k in range(4):
+                shifted = list(params)
+                shifted[k] += h
+                r, _ = optimizer.photographer_residuals(shifted, self.summits, self.projections)
+                for i in range(7):
+                    self.assertAlmostEqual(jac[i, k], (r[i] - residuals[i]) / h, delta=1e-4 * max(1, abs(jac[i, k])))
+
+    def test_find_photographer(self):
+        ref = optimizer.find_photographer(self.summits, self.projections, method="joint")
+        res = optimizer.find_photographer(self.summits, self.projections, method="least_squares", record_path=True)
+        self.assertLess(tools.distance(res.photographer, ref.photographer), 10)
+        self.assertLess(len(res.path), 50)
+
+    def test_fit_photographer(self):
+        fit = optimizer.fit_photographer(self.summits, self.projections, method="joint")
+        self.assertEqual(len(fit.residuals), 7)
+        self.assertEqual(fit.covariance.shape, (4, 4))
+        self.assertTrue(0 <= fit.alpha <= 1)
+        residuals, _ = optimizer.photographer_residuals(
+            (*fit.photographer, fit.alpha, fit.rho), self.summits, self.projections
+        )
+        for r, ref in zip(fit.residuals, residuals * (self.projections[-1] - self.projections[0])):
+            self.assertAlmostEqual(r, ref)
+        # The covariance scales with the variance of the errors on the projections
+        fit1 = optimizer.fit_photographer(self.summits, self.projections, fit.photographer, sigma=1)
+        fit2 = optimizer.fit_photographer(self.summits, self.projections, fit.photographer, sigma=2)
+        self.assertAlmostEqual(fit2.covariance[0, 0], 4 * fit1.covariance[0, 0])
+        # The errors cannot be estimated from the residuals of 5 summits
+        fit = optimizer.fit_photographer(self.summits[:5], self.projections[:5])
+        self.assertIsNone(fit.covariance)
+
+    def test_uncertainty_ellipse(self):
+        ellipse = optimizer.uncertainty_ellipse([[1, 0], [0, 4]], confidence=1 - exp(-0.5))
+        self.assertAlmostEqual(ellipse.semi_major, 2)
+        self.assertAlmostEqual(ellipse.semi_minor, 1)
+        self.assertAlmostEqual(ellipse.azimuth, 0)
+        ellipse = optimizer.uncertainty_ellipse([[4, 0], [0, 1]], confidence=1 - exp(-0.5))
+        self.assertAlmostEqual(ellipse.azimuth, 90)
+
+
+class TestPathRecorder(fixtures.SummitsTestCase):
+
+    def test_decimation(self):
+        recorder = optimizer.PathRecorder(maxlen=4)
+        for i in range(10):
+            recorder.append((i, -i))
+        self.assertEqual(recorder.count, 10)
+        self.assertEqual(recorder.array().tolist(), [[0, 0], [4, -4], [8, -8]])
+        recorder = optimizer.PathRecorder(maxlen=10, decimation=3)
+        for i in range(10):
+            recorder.append((i, -i))
+        self.assertEqual(recorder.array()[:, 0].tolist(), [0, 3, 6, 9])
+
+    def test_find_photographer(self):
+        res = optimizer.find_photographer(self.summits, self.projections, method="joint")
+        self.assertIsNone(res.path)
+        ref = optimizer.find_photographer(self.summits, self.projections, method="joint", record_path=True)
+        self.assertEqual(tuple(res.photographer), tuple(ref.photographer))
+        self.assertEqual(ref.path.shape[1], 2)
+        # The path ends on the photographer
+        self.assertAlmostEqual(tools.distance(ref.path[-1], ref.photographer), 0, 6)
+        res = optimizer.find_photographer(self.summits, self.projections, record_path=True, path_maxlen=10)
+        self.assertLessEqual(len(res.path), 10)
+
+    def test_wsg84(self):
+        latlngs = [(45.9169134, 7.0246497), (45.8999213, 7.0040026), (45.8874995, 7.0069444),
+                   (45.8688259, 6.9879852), (45.8622473, 6.9518381)]
+        projections = [195, 290, 401, 573, 738]
+        res = optimizer.find_photographer_wsg84(latlngs, projections, method="joint", record_path=True)
+        self.assertEqual(res.path.shape[1], 2)
+        self.assertAlmostEqual(res.path[-1][0], res.photographer[0], 6)
+        self.assertAlmostEqual(res.path[-1][1], res.photographer[1], 6)
+
+
+class TestCallback(fixtures.SummitsTestCase):
+
+    def test_progress(self):
+        for method in ("nested", "joint", "least_squares"):
+            ref = optimizer.find_photographer(self.summits, self.projections, method=method)
+            calls = []
+            res = optimizer.find_photographer(self.summits, self.projections, method=method,
+                                              callback=lambda p, e: calls.append((p, e)))
+            self.assertEqual(tuple(res.photographer), tuple(ref.photographer))
+            self.assertGreater(len(calls), 1)
+            self.assertAlmostEqual(tools.distance(calls[-1][0], ref.photographer), 0, 3)
+
+    def test_stop(self):
+        for method in ("nested", "joint", "least_squares"):
+            calls = []
+            def callback(photographer, error):
+                calls.append((photographer, error))
+                return len(calls) == 3
+            res = optimizer.find_photographer(self.summits, self.projections, method=method,
+                                              callback=callback, record_path=True)
+            self.assertEqual(len(calls), 3)
+            # The search stops on the best position so far
+            self.assertEqual(tuple(res.photographer), calls[-1][0])
+            self.assertEqual(res.error, calls[-1][1])
+            self.assertEqual(len(res.path), 3)
+            self.assertIsNotNone(res.init)
+
+
+class TestBudget(fixtures.SummitsTestCase):
+
+    def test_precision(self):
+        for method in ("nested", "joint", "least_squares"):
+            ref = optimizer.find_photographer(self.summits, self.projections, method=method, record_path=True)
+            res = optimizer.find_photographer(self.summits, self.projections, method=method, record_path=True,
+                                              precision=1)
+            self.assertLess(tools.distance(res.photographer, ref.photographer), 2)
+            self.assertLessEqual(len(res.path), len(ref.path))
+
+    def test_max_evaluations(self):
+        for method in ("nested", "joint", "least_squares"):
+            calls = []
+            res = optimizer.find_photographer(self.summits, self.projections, method=method, record_path=True,
+                                              max_evaluations=5, callback=lambda p, e: calls.append((p, e)))
+            self.assertEqual(len(res.path), 5)
+            # The best position so far is returned
+            self.assertEqual((tuple(res.photographer), res.error), calls[-1])
+
+    def test_max_time(self):
+        # The time is up before the area is computed: there is no position yet
+        with self.assertRaisesRegex(RuntimeError, "time budget is exhausted"):
+            optimizer.find_photographer(self.summits, self.projections, max_time=0)
+        # The time is up once the area is computed: the initial position is
+        # returned, without any evaluation by the search
+        area = optimizer.photographer_area
+        def slow_area(summits):
+            time.sleep(0.02)
+            return area(summits)
+        with mock.patch.object(optimizer, "photographer_area", slow_area):
+            res = optimizer.find_photographer(self.summits, self.projections, record_path=True, max_time=0.01)
+        self.assertEqual(len(res.path), 0)
+        self.assertEqual(tuple(res.photographer), tuple(res.init))
+        picture = optimizer.optimize_picture(tuple(res.init), self.summits, self.projections, "vectorized")
+        self.assertEqual(res.error, picture.error)
+        # The time is checked between the searches of the candidates of the grid
+        with mock.patch.object(optimizer, "photographer_area", slow_area):
+            res = optimizer.find_photographer(self.summits, self.projections, init="grid", record_path=True,
+                                              max_time=0.01)
+        self.assertEqual(len(res.path), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
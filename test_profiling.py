@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import unittest
+
+import optimizer
+import profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    summits = [(1, 10), (4, 11), (8, 9), (12, 12), (15, 10)]
+    projections = [0, 280.0, 710.0, 1050.0, 1400.0]
+
+    def test_profile(self):
+        with profiling.Profile() as profile:
+            optimizer.find_photographer(self.summits, self.projections)
+        breakdown = profile.breakdown()
+        self.assertEqual(breakdown["area"]["calls"], 1)
+        self.assertEqual(breakdown["search"]["calls"], 1)
+        self.assertGreater(breakdown["picture"]["calls"], 10)
+        self.assertLessEqual(breakdown["picture"]["seconds"], breakdown["search"]["seconds"])
+        # Nothing is measured outside of a profile
+        optimizer.find_photographer(self.summits, self.projections)
+        self.assertEqual(profile.breakdown(), breakdown)
+
+    def test_nested_stage(self):
+        @profiling.profiled("stage")
+        def recursive(n):
+            return recursive(n - 1) if n else 0
+
+        with profiling.Profile() as profile:
+            recursive(3)
+            with profiling.stage("other"):
+                recursive(1)
+        self.assertEqual(profile.calls, {"stage": 2, "other": 1})
+
+    def test_metrics(self):
+        metrics = profiling.StageMetrics()
+        metrics.observe({"area": {"calls": 1, "seconds": 0.002}})
+        metrics.observe({"area": {"calls": 3, "seconds": 0.2}})
+        lines = metrics.exposition().splitlines()
+        self.assertIn("# TYPE photographer_stage_seconds histogram", lines)
+        self.assertIn('photographer_stage_seconds_bucket{stage="area",le="0.005"} 1', lines)
+        self.assertIn('photographer_stage_seconds_bucket{stage="area",le="+Inf"} 2', lines)
+        self.assertIn('photographer_stage_calls_bucket{stage="area",le="1"} 1', lines)
+        self.assertIn('photographer_stage_calls_sum{stage="area"} 4', lines)
+        self.assertIn('photographer_stage_calls_count{stage="area"} 2', lines)
+
+    def test_evaluation_counter(self):
+        with profiling.EvaluationCounter() as counter:
+            optimizer.find_photographer(self.summits, self.projections)
+        self.assertGreater(counter.count, 10)
+        self.assertEqual(counter.breakdown()["evaluation"], {"calls": counter.count, "seconds": 0})
+        # Nothing is counted once the counter is closed
+        count = counter.count
+        optimizer.find_photographer(self.summits, self.projections)
+        self.assertEqual(counter.count, count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import score
+import synthetic
+
+
+class TestScore(unittest.TestCase):
+
+    results = [
+        {"configuration": "a", "case": "x", "error": 100, "time": 0.5, "evaluations": 10, "status": "ok"},
+        {"configuration": "a", "case": "y", "error": 51, "time": 0.1, "evaluations": 20, "status": "ok"},
+        {"configuration": "a", "case": "z", "error": None, "time": None, "evaluations": None, "status": "failed"},
+    ]
+
+    def test_parse_configuration(self):
+        self.assertEqual(score.parse_configuration("method=joint, budget=300"), {"method": "joint", "budget": 300})
+        self.assertEqual(score.parse_configuration("precision=0.5,max_evaluations=50"),
+                         {"precision": 0.5, "max_evaluations": 50})
+        self.assertEqual(score.parse_configuration("record_path=False,max_time=None"),
+                         {"record_path": False, "max_time": None})
+        self.assertEqual(score.parse_configuration(""), {})
+        with self.assertRaises(RuntimeError):
+            score.parse_configuration("joint")
+
+    def test_summarize(self):
+        summary = score.summarize(self.results)["a"]
+        self.assertEqual((summary["cases"], summary["average_error"], summary["failures"]), (2, 75, 1))
+        self.assertAlmostEqual(summary["time"], 0.6)
+        self.assertEqual(summary["evaluations"], 30)
+
+    def test_compare(self):
+        self.assertEqual(score.compare(self.results, self.results), [])
+        results = [dict(r) for r in self.results]
+        results[0]["error"] = 104
+        results[1].update(time=1, status="failed")
+        self.assertEqual(score.compare(results, self.results), ["a y: fails (failed)"])
+        results[0]["error"], results[0]["time"] = 200, 2
+        self.assertEqual(len(score.compare(results, self.results)), 3)
+
+    def test_readme_section(self):
+        section = score.readme_section("Title", self.results)
+        self.assertTrue(section.startswith("### Title\n\n-- Cases --\n\n- x: 100 meters\n"))
+        self.assertIn("2 cases\nAverage error: 75 meters\n", section)
+
+    def test_score(self):
+        with tempfile.TemporaryDirectory() as data:
+            synthetic.write_case(Path(data) / "case", synthetic.generate_case(5, seed=0))
+            for workers in (1, 2):
+                [result] = score.score(workers=workers, data=data)
+                self.assertEqual(result["status"], "ok")
+                self.assertLess(result["error"], 100)
+                self.assertGreater(result["evaluations"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import fixtures
+import server
+
+
+def events(response):
+    """Yield the (event, data) of the server-sent events of a response."""
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+class TestLocate(unittest.TestCase):
+
+    def setUp(self):
+        # Each test solves its queries: nothing comes from the cache.
+        patcher = mock.patch.object(server, "cache", server.LocateCache(0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_locate(self):
+        with TestClient(server.app) as client:
+            reply = client.post("/locate/", json=fixtures.example_query()).json()
+        self.assertEqual(reply["status"], "ok")
+        self.assertEqual(len(reply["location"]), 2)
+
+    def test_fitted_location(self):
+        q = fixtures.example_query()
+        projections = [p[0] for p in q["projections"]]
+        reply = server.locate_photographer(q["latlngs"], projections)
+        found = server.find_photographer_wsg84(q["latlngs"], projections)
+        fit = server.fit_photographer_wsg84(q["latlngs"], projections, found.photographer, server.LOCATE_SIGMA)
+        # The location is the center of the ellipse of uncertainty
+        self.assertEqual(reply["location"], [float(x) for x in fit.photographer])
+        self.assertEqual(reply["residuals"], [float(r) for r in fit.residuals])
+
+    def test_queue_full(self):
+        with mock.patch.object(server, "LOCATE_QUEUE_SIZE", 0), TestClient(server.app) as client:
+            response = client.post("/locate/", json=fixtures.example_query())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["retry-after"], "1")
+
+    def test_timeout(self):
+        with mock.patch.object(server, "LOCATE_TIMEOUT", 0.001), TestClient(server.app) as client:
+            response = client.post("/locate/", json=fixtures.example_query())
+        self.assertEqual(response.status_code, 504)
+
+    def test_profile_not_cached(self):
+        with mock.patch.object(server, "cache", server.LocateCache()), \
+             mock.patch.object(server, "LOCATE_PROFILE", True), TestClient(server.app) as client:
+            fresh = client.post("/locate/", json=fixtures.example_query()).json()
+            cached = client.post("/locate/", json=fixtures.example_query()).json()
+        self.assertIn("search", fresh["profile"])
+        self.assertNotIn("profile", cached)
+        self.assertEqual(cached, {k: v for k, v in fresh.items() if k != "profile"})
+
+    def test_stopped_not_cached(self):
+        stopped = dict(fixtures.example_query(), max_evaluations=3)
+        with mock.patch.object(server, "cache", server.LocateCache()), TestClient(server.app) as client:
+            replies = [client.post("/locate/", json=stopped).json() for _ in range(2)]
+            self.assertEqual(client.get("/cache/").json()["entries"], 0)
+            converged = client.post("/locate/", json=fixtures.example_query()).json()
+            self.assertEqual(client.get("/cache/").json()["entries"], 1)
+        self.assertTrue(replies[0]["stopped"])
+        self.assertFalse(converged["stopped"])
+
+    def test_key(self):
+        q = fixtures.example_query()
+        key = server.locate_key(q["latlngs"], [p[0] for p in q["projections"]])
+        for setting, value in (("LOCATE_CONFIDENCE", 0.5), ("LOCATE_ALTERNATIVES", 2)):
+            with mock.patch.object(server, setting, value):
+                self.assertNotEqual(server.locate_key(q["latlngs"], [p[0] for p in q["projections"]]), key)
+
+    def test_max_time(self):
+        q = dict(fixtures.synthetic_query(), max_time=0.2)
+        with TestClient(server.app) as client:
+            # The worker is started by a first query
+            client.post("/locate/", json=fixtures.example_query())
+            start = time.monotonic()
+            reply = client.post("/locate/", json=q).json()
+            # The time is checked before the search and between its evaluations
+            # (of about 0.05s for 100 summits).
+            self.assertLess(time.monotonic() - start, 1.5 * q["max_time"])
+        self.assertEqual(reply["status"], "ok")
+        # The time is up after the search: its location is not fitted.
+        self.assertEqual(reply["residuals"], [])
+        self.assertIsNone(reply["uncertainty"])
+        self.assertTrue(reply["stopped"])
+
+    def test_invalid_query(self):
+        q = fixtures.example_query()
+        q["projections"] = q["projections"][:-1]
+        with TestClient(server.app) as client:
+            self.assertEqual(client.post("/locate/", json=q).status_code, 422)
+            self.assertEqual(client.post("/locate/", json={"latlngs": [], "projections": []}).status_code, 422)
+
+    def test_batch_with_invalid_queries(self):
+        mismatched = fixtures.example_query()
+        mismatched["projections"] = mismatched["projections"][:-1]
+        with TestClient(server.app) as client:
+            response = client.post("/locate/batch", json=[{}, mismatched, fixtures.example_query()])
+        replies = {r["index"]: r for r in map(json.loads, response.text.splitlines())}
+        self.assertEqual(sorted(replies), [0, 1, 2])
+        self.assertTrue(replies[0]["status"].startswith("Invalid query"))
+        self.assertTrue(replies[1]["status"].startswith("Invalid query"))
+        self.assertEqual(replies[2]["status"], "ok")
+
+    def test_batch_larger_than_queue(self):
+        # The queries of a batch wait for the pool instead of failing.
+        with mock.patch.object(server, "LOCATE_QUEUE_SIZE", 1), \
+             mock.patch.object(server, "LOCATE_BATCH_CONCURRENCY", 3), TestClient(server.app) as client:
+            response = client.post("/locate/batch", json=[fixtures.example_query()] * 3)
+        replies = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([r["status"] for r in replies], ["ok"] * 3)
+
+    def test_ndjson_streamed(self):
+        line = json.dumps(fixtures.example_query()).encode() + b"\n"
+
+        async def batch():
+            # The second query is only sent once the reply of the first one is received.
+            lines, replies, replied = [line, line], [], asyncio.Event()
+
+            async def receive():
+                if not lines:
+                    await asyncio.Event().wait()
+                if len(lines) == 1:
+                    await replied.wait()
+                return {"type": "http.request", "body": lines.pop(0), "more_body": bool(lines)}
+
+            async def send(message):
+                if message["type"] == "http.response.body" and message["body"]:
+                    replies.append(json.loads(message["body"]))
+                    replied.set()
+
+            scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+                     "method": "POST", "scheme": "http", "path": "/locate/batch", "raw_path": b"/locate/batch",
+                     "root_path": "", "query_string": b"", "client": ("testclient", 50000),
+                     "server": ("testserver", 80), "headers": [(b"content-type", b"application/x-ndjson")]}
+            await asyncio.wait_for(server.app(scope, receive, send), 30)
+            return replies
+
+        with TestClient(server.app) as client:
+            replies = client.portal.call(batch)
+        self.assertEqual(sorted(r["index"] for r in replies), [0, 1])
+        self.assertEqual([r["status"] for r in replies], ["ok", "ok"])
+
+
+
+class TestLocateStream(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(server, "cache", server.LocateCache(0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_progress(self):
+        with TestClient(server.app) as client:
+            with client.stream("POST", "/locate/stream", json=fixtures.example_query()) as response:
+                received = list(events(response))
+        names = [event for event, _ in received]
+        self.assertGreater(names.count("progress"), 0)
+        self.assertEqual(names[-1], "result")
+        self.assertEqual(received[-1][1]["status"], "ok")
+        self.assertEqual(len(received[0][1]["location"]), 2)
+
+    def test_cancel(self):
+        # A single worker: the next solve waits for the cancelled one.
+        async def first_event():
+            # The test client only disconnects once the response is complete:
+            # close the stream after its first event, as a server does when its client is gone.
+            response = await server.locate_stream(server.Locate(**fixtures.synthetic_query()))
+            try:
+                return await anext(response.body_iterator)
+            finally:
+                await response.body_iterator.aclose()
+
+        with mock.patch.object(server, "LOCATE_WORKERS", 1), TestClient(server.app) as client:
+            start = time.monotonic()
+            self.assertTrue(client.portal.call(first_event).startswith("event: progress"))
+            self.assertEqual(client.post("/locate/", json=fixtures.example_query()).json()["status"], "ok")
+            self.assertLess(time.monotonic() - start, 4)
+
+    def test_timeout(self):
+        with mock.patch.object(server, "LOCATE_TIMEOUT", 0.5), TestClient(server.app) as client:
+            start = time.monotonic()
+            with client.stream("POST", "/locate/stream", json=fixtures.synthetic_query()) as response:
+                received = list(events(response))
+            self.assertEqual(received[-1], ("result", {"status": "The computation took too long."}))
+            self.assertLess(time.monotonic() - start, 4)
+
+
+
+class TestAssets(unittest.TestCase):
+
+    def setUp(self):
+        # A new asset store and catalog, built by the startup of the server.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = server.AssetStore(directory.name)
+        for name, value in (("assets", store), ("examples", server.ExampleCatalog("data", store))):
+            patcher = mock.patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_catalog_built_at_startup(self):
+        with TestClient(server.app):
+            names = json.loads(server.examples.list()[0])
+            self.assertEqual(sorted(server.examples.entries), names)
+            self.assertEqual(len(server.assets.sources), len(names))
+
+    def test_unregistered_picture(self):
+        with open("data/frankfurt/info.json") as f:
+            picture = "data/frankfurt/{}".format(json.load(f)["picture"])
+        hash = server.AssetStore().register(picture)
+        with TestClient(server.app) as client:
+            # The pictures are forgotten after the startup (e.g. the catalog was reloaded).
+            server.assets.sources.clear()
+            server.examples.reload()
+            response = client.get("/assets/{}/thumbnail.webp".format(hash))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(client.get("/assets/0123456789abcdef/thumbnail.webp").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
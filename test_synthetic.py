@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+import unittest
+
+import utm
+
+import synthetic
+from optimizer import find_photographer_wsg84
+from tools import distance
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_generate_case(self):
+        info = synthetic.generate_case(30, noise=2, mislabeled=3, seed=1)
+        self.assertEqual(len(info["latlngs"]), 30)
+        xs = [x for x, _ in info["projections"]]
+        self.assertEqual(xs, sorted(xs))
+        self.assertEqual(len(info["synthetic"]["mislabeled"]), 3)
+        # The same seed gives the same case
+        self.assertEqual(synthetic.generate_case(30, noise=2, mislabeled=3, seed=1), info)
+        with self.assertRaises(RuntimeError):
+            synthetic.generate_case(2)
+
+    def test_exact_case(self):
+        info = synthetic.generate_case(10, seed=0)
+        computed = find_photographer_wsg84(info["latlngs"], [x for x, _ in info["projections"]], method="joint")
+        real = utm.from_latlon(*info["photographer_latlng"])
+        found = utm.from_latlon(*computed.photographer, force_zone_number=real[2], force_zone_letter=real[3])
+        self.assertLess(distance(real[:2], found[:2]), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
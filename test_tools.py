@@ -3,6 +3,8 @@
 import unittest
 from math import fabs, sqrt
 
+import numpy as np
+
 import tools
 
 
@@ -18,6 +20,14 @@ class TestDistance(unittest.TestCase):
         self.assertEqual(tools.distance((12, 13), (12, 13)), 0)
         self.assertEqual(tools.distance((12.0, 13.0), (12.0, 13.0)), 0)
 
+    def test_batch(self):
+        points = np.array([(0, 0), (1, 0), (4, 4), (12, 13)])
+        distances = tools.distance_batch(points[:, None], points[None, :])
+        self.assertEqual(distances.shape, (4, 4))
+        for i, p in enumerate(points):
+            for j, q in enumerate(points):
+                self.assertEqual(distances[i, j], tools.distance(p, q))
+
 
 class TestIntersectionLines(unittest.TestCase):
 
@@ -60,6 +70,20 @@ class TestIntersectionLines(unittest.TestCase):
             None,
         )
 
+    def test_batch(self):
+        # N lines against one line
+        a1 = np.array([(-1.0, -1.0), (-1.0, 0.0), (-1.0, 1.0), (2.0, 1.0), (3.0, 7.0)])
+        a2 = np.array([(1.0, 1.0), (1.0, 0.0), (1.0, 1.0), (1.0, 1.0), (-2.0, 5.0)])
+        b1, b2 = (-1.0, 1.0), (1.0, -1.0)
+        inters = tools.intersection_lines_batch(a1, a2, b1, b2)
+        self.assertEqual(inters.shape, (5, 2))
+        for p, q, inter in zip(a1, a2, inters):
+            expected = tools.intersection_lines(p, q, b1, b2)
+            if expected is None:
+                self.assertTrue(np.all(np.isnan(inter)))
+            else:
+                self.assertEqual(tuple(inter), expected)
+
 
 class TestDot(unittest.TestCase):
 
@@ -68,6 +92,9 @@ class TestDot(unittest.TestCase):
         self.assertEqual(tools.dot((0, 1), (1, 0)), 0)
         self.assertEqual(tools.dot((0, 1), (0, -1)), -1)
 
+    def test_batch(self):
+        self.assertEqual(list(tools.dot_batch([(0, 1), (0, 1), (0, 1)], [(0, 1), (1, 0), (0, -1)])), [1, 0, -1])
+
 
 class TestDet(unittest.TestCase):
 
@@ -77,6 +104,10 @@ class TestDet(unittest.TestCase):
         self.assertEqual(tools.det((1, 0), (1, 0)), 0)
         self.assertEqual(tools.det((2, 0), (0, 1)), 2)
 
+    def test_batch(self):
+        self.assertEqual(list(tools.det_batch((1, 0), [(0, 1), (0, -1), (1, 0)])), [1, -1, 0])
+        self.assertEqual(list(tools.det_batch([(1, 0), (2, 0)], (0, 1))), [1, 2])
+
 
 class TestBarycenter(unittest.TestCase):
 
@@ -112,6 +143,34 @@ class TestExtrems(unittest.TestCase):
                          ),
                          ((2, -1), (-2, -1))
         )
+
+    def test_batch(self):
+        points = [
+            [(-2, 1), (-1, 1), (0, 1), (1, 1), (2, 1)],
+            [(-2, -1), (-1, -1), (0, -1), (1, -1), (2, -1)],
+            [(-1, 1), (-2, 1), (0, 1), (1, 1), (2, 1)],
+            [(-2, -1), (-1, -1), (2, -1), (0, -1), (1, -1)],
+        ]
+        lefts, rights = tools.extrems_batch((0, 0), points)
+        for ps, left, right in zip(points, lefts, rights):
+            self.assertEqual((tuple(left), tuple(right)), tools.extrems((0, 0), ps))
+
+
+class TestIsValidLocation(unittest.TestCase):
+
+    def test_batch(self):
+        summits = [(100, 400), (200, 300), (400, 400), (400, 250), (300, 100)]
+        points = np.array([(x, y) for x in range(0, 500, 25) for y in range(0, 500, 25)])
+        valid = tools.is_valid_location_batch(points, summits)
+        self.assertEqual(valid.shape, (len(points),))
+        self.assertTrue(valid.any())
+        self.assertFalse(valid.all())
+        for p, v in zip(points, valid):
+            self.assertEqual(v, tools.is_valid_location(p, summits))
+        grid = points.reshape(20, 20, 2)
+        self.assertEqual(tools.is_valid_location_batch(grid, summits).shape, (20, 20))
+
+
 class TestPhotographerArea(unittest.TestCase):
 
     def test_basic(self):
@@ -257,6 +316,40 @@ class TestPhotographerArea(unittest.TestCase):
              (226.0, 174.0)]
         )
 
+    def test_bruteforce(self):
+        summits = [(553, 410), (560, 221), (488, 145), (424, 22), (298, 104), (226, 174), (153, 50)]
+        self.assertEqual(
+            sorted(tools.photographer_area(summits)),
+            sorted(tools.photographer_area_bruteforce(summits))
+        )
+        # Corners where many vectors cross are returned once
+        summits = [(141, 380), (216, 414.253), (281, 485), (325.498, 359.526), (396, 418.448)]
+        envelop = tools.photographer_area(summits, xmin=0, xmax=900, ymin=0, ymax=800)
+        self.assertEqual(len(envelop), 4)
+        for p, q in zip(envelop, tools.photographer_area_bruteforce(summits, xmin=0, xmax=900, ymin=0, ymax=800)[2:]):
+            self.assertAlmostEqual(p[0], q[0])
+            self.assertAlmostEqual(p[1], q[1])
+
+    def test_half_planes_intersection(self):
+        square = [(0, 0), (0, 1), (1, 1), (1, 0)]
+        vectors = list(zip(square, square[1:] + square[:1]))
+        self.assertEqual(sorted(tools.half_planes_intersection(vectors)), [0, 1, 2, 3])
+        # A redundant constraint
+        self.assertEqual(sorted(tools.half_planes_intersection(vectors + [((2, 1), (2, 0))])), [0, 1, 2, 3])
+        # An incompatible constraint
+        self.assertEqual(tools.half_planes_intersection(vectors + [((2, 0), (2, 1))]), [])
+
+    def test_is_in_envelop_batch(self):
+        envelop = tools.sort_envelop([(0, 0), (2, 0), (2, 1), (0, 1)])
+        points = [(1, 0.5), (0, 0), (2.1, 0.5), (1, -0.1)]
+        self.assertEqual(tools.is_in_envelop_batch(points, envelop).tolist(), [True, True, False, False])
+
+    def test_halton(self):
+        points = tools.halton(8)
+        self.assertEqual(points[:3].tolist(), [[1 / 2, 1 / 3], [1 / 4, 2 / 3], [3 / 4, 1 / 9]])
+        # The points are spread evenly: one in each eighth along x
+        self.assertEqual(sorted((points[:, 0] * 8).astype(int).tolist()), list(range(8)))
+
 class TestSummitsSelection(unittest.TestCase):
 
     def test_basic(self):
@@ -266,6 +359,38 @@ class TestSummitsSelection(unittest.TestCase):
         self.assertEqual(ll[0], [0, 1, 2, 3, 4])
         self.assertEqual(ll[20], [2, 3, 4, 5, 6])
 
+    def test_size(self):
+        l = [1, 2, 3, 4, 5, 6, 7]
+        self.assertEqual(len(list(tools.selections_of_summits(l, 3))), 35)
+        self.assertEqual(len(list(tools.selections_of_summits(l, 4))), 35)
+        with self.assertRaises(RuntimeError):
+            next(tools.selections_of_summits(l, 2))
+
+    def test_shard(self):
+        l = [1, 2, 3, 4, 5, 6, 7]
+        shards = [list(tools.selections_of_summits(l, 5, shard=(i, 3))) for i in range(3)]
+        self.assertEqual([len(s) for s in shards], [7, 7, 7])
+        self.assertEqual(
+            sorted(sum(shards, [])),
+            tools.selections_of_five_summits(l)
+        )
+        with self.assertRaises(RuntimeError):
+            next(tools.selections_of_summits(l, 5, shard=(3, 3)))
+
+    def test_skip(self):
+        l = [1, 2, 3, 4, 5, 6, 7]
+        ll = list(tools.selections_of_summits(l, 5, skip=[[0, 1, 2, 3, 4], (2, 3, 4, 5, 6)]))
+        self.assertEqual(len(ll), 19)
+        self.assertEqual(ll[0], [0, 1, 2, 3, 5])
+
+    def test_count(self):
+        l = list(range(9))
+        skip = [[0, 1, 2, 3, 4], (2, 3, 4, 5, 6), (0, 1, 2, 3, 5), (4, 5, 6, 7, 8), (0, 0, 1, 2, 3), (6, 7, 8)]
+        for k in (3, 4, 5):
+            for shard in (None, (0, 3), (1, 3), (2, 3), (4, 7)):
+                self.assertEqual(tools.count_selections_of_summits(l, k, shard, skip),
+                                 len(list(tools.selections_of_summits(l, k, shard, skip))))
+
 
 class TestChangeCoordinate(unittest.TestCase):
 
@@ -4,10 +4,16 @@
 Toolings!
 """
 
+import itertools
+from collections import deque
+
+import numpy as np
 from PIL import Image as PILImage
 from PIL import ImageDraw
 
-from math import sqrt
+from math import comb, sqrt
+
+from profiling import profiled
 
 
 def intersection_lines(a1, a2, b1, b2):
@@ -22,21 +28,56 @@ def intersection_lines(a1, a2, b1, b2):
     return (a1[0] + ua * (a2[0] - a1[0]), a1[1] + ua * (a2[1] - a1[1]))
 
 
+def intersection_lines_batch(a1, a2, b1, b2):
+    """
+    Vectorized intersection_lines: the points are arrays (..., 2) that broadcast
+    together (e.g. N lines against one line).
+    Return an array (..., 2) of intersections, NaN where the lines are parallel.
+    """
+    a1, a2, b1, b2 = (np.asarray(p, dtype=float) for p in (a1, a2, b1, b2))
+    den = det_batch(a2 - a1, b2 - b1)
+    num = det_batch(b2 - b1, a1 - b1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ua = np.where(den == 0, np.nan, num / den)
+    return a1 + ua[..., None] * (a2 - a1)
+
+
 def distance(a, b):
     """Return the distance between two points."""
     return sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2)
 
 
+def distance_batch(a, b):
+    """
+    Return the distances between two arrays (..., 2) of points.
+    e.g. distance_batch(points[:, None], points[None, :]) are the pairwise distances.
+    """
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return np.sqrt((b[..., 0] - a[..., 0]) ** 2 + (b[..., 1] - a[..., 1]) ** 2)
+
+
 def dot(u, v):
     """Return the dot product of two vectors."""
     return u[0] * v[0] + u[1] * v[1]
 
 
+def dot_batch(u, v):
+    """Return the dot products of two arrays (..., 2) of vectors."""
+    u, v = np.asarray(u, dtype=float), np.asarray(v, dtype=float)
+    return u[..., 0] * v[..., 0] + u[..., 1] * v[..., 1]
+
+
 def det(u, v):
     """Return the determinant of two vectors."""
     return u[0] * v[1] - u[1] * v[0] 
 
 
+def det_batch(u, v):
+    """Return the determinants of two arrays (..., 2) of vectors."""
+    u, v = np.asarray(u, dtype=float), np.asarray(v, dtype=float)
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
 def barycenter(points, weights=None):
     """Compute the barycenter of a list of points (that have the same weight)."""
     if weights is None:
@@ -66,6 +107,49 @@ def is_valid_location(point, summits):
     return True
 
 
+def is_valid_location_batch(points, summits):
+    """
+    Vectorized is_valid_location for an array (..., 2) of points.
+    Return an array (...) of booleans.
+    """
+    points = np.asarray(points, dtype=float)
+    vectors = np.asarray(summits, dtype=float) - points[..., None, :]
+    valid = np.ones(points.shape[:-1], dtype=bool)
+    for i in range(0, len(summits)):
+        for j in range(i + 1, len(summits)):
+            valid &= det_batch(vectors[..., j, :], vectors[..., i, :]) >= 0
+    return valid
+
+
+def is_in_envelop_batch(points, envelop):
+    """
+    Return an array (...) of booleans, True for the points of an array (..., 2)
+    that are within a convex envelop (in trigo order, see sort_envelop).
+    """
+    points = np.asarray(points, dtype=float)
+    envelop = np.asarray(envelop, dtype=float)
+    edges = np.roll(envelop, -1, axis=0) - envelop
+    return np.all(det_batch(edges, points[..., None, :] - envelop) >= 0, axis=-1)
+
+
+def halton(n, bases=(2, 3)):
+    """
+    Return the array (n, len(bases)) of the first n points of the Halton
+    sequence in [0, 1)^len(bases): a low-discrepancy sequence, i.e. whose
+    points cover the space evenly (without its first point, 0).
+    """
+    points = np.empty((n, len(bases)))
+    for d, base in enumerate(bases):
+        for i in range(n):
+            k, f, r = i + 1, 1, 0
+            while k > 0:
+                f /= base
+                r += f * (k % base)
+                k //= base
+            points[i, d] = r
+    return points
+
+
 def filter_points_on_the_right(points, vectors):
     """
     filter the points that are on the right of all the vectors.
@@ -110,6 +194,23 @@ def extrems(origin, points):
         return qq, pp 
 
 
+def extrems_batch(origins, points):
+    """
+    Vectorized extrems for arrays of origins (..., 2) and of points (..., N, 2).
+    Return the arrays (..., 2) of the leftmost and rightmost points.
+    """
+    origins, points = np.asarray(origins, dtype=float), np.asarray(points, dtype=float)
+    # Find the two most extrem points
+    n = points.shape[-2]
+    distances = distance_batch(points[..., :, None, :], points[..., None, :, :])
+    best = np.argmax(distances.reshape(distances.shape[:-2] + (n * n,)), axis=-1)
+    pp = np.take_along_axis(points, (best // n)[..., None, None], axis=-2)[..., 0, :]
+    qq = np.take_along_axis(points, (best % n)[..., None, None], axis=-2)[..., 0, :]
+    # Order the points
+    left = (det_batch(pp - origins, qq - origins) <= 0)[..., None]
+    return np.where(left, pp, qq), np.where(left, qq, pp)
+
+
 def find_all_intersections(vectors):
     """
     return all vectors intersections.
@@ -123,12 +224,156 @@ def find_all_intersections(vectors):
     return list(intersections)
 
 
+def summit_vectors_of(summits):
+    """
+    Return the vectors between all pairs of summits (the photographer is on their right).
+    """
+    return [(summits[i], summits[j]) for i in range(len(summits)) for j in range(i + 1, len(summits))]
+
+
+def zone_of(center, halfsize):
+    """
+    Return the corners (clockwise) of the square of 'halfsize' centered on 'center'.
+    """
+    return [(center[0] - halfsize, center[1] - halfsize),
+            (center[0] - halfsize, center[1] + halfsize),
+            (center[0] + halfsize, center[1] + halfsize),
+            (center[0] + halfsize, center[1] - halfsize)]
+
+
+def half_planes_intersection(vectors):
+    """
+    Return the indexes of the vectors bounding the area on the right of all
+    the vectors, in the (anti clockwise) order they bound it. Return [] if
+    the area is empty.
+    The vectors must bound the area (e.g. include an enclosing zone).
+    This is the sort of the vectors by angle (O(m log m)) followed by a linear sweep.
+    """
+    if len(vectors) < 3:
+        return []
+    vectors = np.asarray(vectors, dtype=float)
+    # Reverse the vectors, so that the area is on their left.
+    points, directions = vectors[:, 1], vectors[:, 0] - vectors[:, 1]
+    eps = 1e-12 * np.abs(vectors).max()
+    order = np.argsort(np.arctan2(directions[:, 1], directions[:, 0]), kind="stable")
+    points, directions = points.tolist(), directions.tolist()
+
+    def out(i, r):
+        # Is the point r strictly on the right of the line i (i.e. out of the area)?
+        (px, py), (dx, dy) = points[i], directions[i]
+        return dx * (r[1] - py) - dy * (r[0] - px) < -eps * sqrt(dx * dx + dy * dy)
+
+    def inter(i, j):
+        (px, py), (dx, dy) = points[i], directions[i]
+        (qx, qy), (ex, ey) = points[j], directions[j]
+        t = (ex * (py - qy) - ey * (px - qx)) / (dx * ey - dy * ex)
+        return (px + t * dx, py + t * dy)
+
+    def parallel(i, j):
+        (dx, dy), (ex, ey) = directions[i], directions[j]
+        return abs(dx * ey - dy * ex) <= 1e-12 * sqrt((dx * dx + dy * dy) * (ex * ex + ey * ey))
+
+    bounds = deque()
+    for i in order.tolist():
+        while len(bounds) > 1 and out(i, inter(bounds[-1], bounds[-2])):
+            bounds.pop()
+        while len(bounds) > 1 and out(i, inter(bounds[0], bounds[1])):
+            bounds.popleft()
+        if bounds and parallel(i, bounds[-1]):
+            (dx, dy), (ex, ey) = directions[i], directions[bounds[-1]]
+            if dx * ex + dy * ey < 0:
+                # Opposite half-planes
+                if out(i, points[bounds[-1]]):
+                    return []
+            elif out(i, points[bounds[-1]]):
+                # Keep the most restrictive of the parallel half-planes
+                bounds.pop()
+            else:
+                continue
+        bounds.append(i)
+    while len(bounds) > 2 and out(bounds[0], inter(bounds[-1], bounds[-2])):
+        bounds.pop()
+    while len(bounds) > 2 and out(bounds[-1], inter(bounds[0], bounds[1])):
+        bounds.popleft()
+    if len(bounds) < 3:
+        return []
+    return list(bounds)
+
+
+def area_corners(vectors, bounds):
+    """
+    Return the corners of the area bounded by the vectors of indexes 'bounds'
+    (see half_planes_intersection), with the indexes of their two vectors.
+    Corners where more than two vectors cross (e.g. summits) are returned once.
+    """
+    scale = max(abs(x) for v in vectors for p in v for x in p)
+    corners = []
+    for i, j in zip(bounds, bounds[1:] + bounds[:1]):
+        i, j = min(i, j), max(i, j)
+        inter = intersection_lines(vectors[i][0], vectors[i][1], vectors[j][0], vectors[j][1])
+        if inter is None:
+            continue
+        if corners and distance(corners[-1][0], inter) <= 1e-9 * scale:
+            continue
+        corners.append((inter, i, j))
+    if len(corners) > 1 and distance(corners[0][0], corners[-1][0]) <= 1e-9 * scale:
+        corners.pop()
+    return corners
+
+
+def _cycle(points):
+    """Return the vectors between the consecutive points of a closed polygon."""
+    return list(zip(points, points[1:] + points[:1]))
+
+
+@profiled("area")
 def photographer_area(summits, xmin=None, xmax=None, ymin=None, ymax=None):
     """
     Return the envelop (a list of point) of the area where the photograph is located.
     summits: list of summits coordinates (x, y) in the order they appears on the picture (left to right).
     xmin, ... ymax: the enclosing area of the map.
     """
+    summit_vectors = summit_vectors_of(summits)
+    error = RuntimeError(
+        "Such a picture cannot be taken. "
+        "Check the location and order of the points on the map and picture."
+    )
+
+    # An enclosing zone is needed to ensure a "closed" area
+    if xmin is None:
+        # Find all the corners of the area, within a (huge) zone whose corners are ignored.
+        bary_summit = barycenter(summits)
+        halfsize = 1e6 * (1 + max([distance(bary_summit, p) for p in summits]))
+        vectors = summit_vectors + _cycle(zone_of(bary_summit, halfsize))
+        bounds = half_planes_intersection(vectors)
+        if len(bounds) == 0:
+            raise error
+        envelop = [p for (p, i, j) in area_corners(vectors, bounds) if j < len(summit_vectors)]
+        # Let's define a square centered on the barycentre and big enough to contain it all.
+        mdist = 2 * max([distance(bary_summit, p) for p in envelop + summits])
+        zone = zone_of(bary_summit, mdist)
+    else:
+        zone = [(xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin)]
+
+    # Find all the corners of the area
+    close_vectors = summit_vectors + _cycle(zone)
+    bounds = half_planes_intersection(close_vectors)
+    if len(bounds) == 0:
+        raise error
+    close_envelop = [p for (p, i, j) in area_corners(close_vectors, bounds)]
+    if len(close_envelop) < 3:
+        raise error
+    return sort_envelop(close_envelop)
+
+
+def photographer_area_bruteforce(summits, xmin=None, xmax=None, ymin=None, ymax=None):
+    """
+    Return the envelop (a list of point) of the area where the photograph is located.
+    summits: list of summits coordinates (x, y) in the order they appears on the picture (left to right).
+    xmin, ... ymax: the enclosing area of the map.
+    This intersects all pairs of vectors between summits (O(n^4)): this is
+    the reference of photographer_area, kept for tests and benchmarks.
+    """
 
     # Compute all summit vectors (photographer is on the right of those vectors)
     summit_vectors = []
@@ -167,33 +412,83 @@ def photographer_area(summits, xmin=None, xmax=None, ymin=None, ymax=None):
             "Check the location and order of the points on the map and picture."
         )
 
-    # Sort points (trigo order) of the (convex) envelop of the area
-    bary_envelop = barycenter(close_envelop)
+    return sort_envelop(close_envelop)
+
+
+def sort_envelop(envelop):
+    """
+    Sort the points of a convex envelop in trigo order, starting from
+    the rightmost point above its barycenter.
+    """
+    bary_envelop = barycenter(envelop)
     pabovesorted = sorted(
-        [p for p in close_envelop if p[1] - bary_envelop[1] >= 0],
+        [p for p in envelop if p[1] - bary_envelop[1] >= 0],
         key=lambda p: -(p[0] - bary_envelop[0]) / sqrt((p[0] - bary_envelop[0]) ** 2 + (p[1] - bary_envelop[1]) ** 2),
     )
     pbelowsorted = sorted(
-        [p for p in close_envelop if p[1] - bary_envelop[1] < 0],
+        [p for p in envelop if p[1] - bary_envelop[1] < 0],
         key=lambda p: (p[0] - bary_envelop[0]) / sqrt((p[0] - bary_envelop[0]) ** 2 + (p[1] - bary_envelop[1]) ** 2),
     )
-    area = pabovesorted + pbelowsorted
-    return area
+    return pabovesorted + pbelowsorted
+
+
+def selections_of_summits(summits, k=5, shard=None, skip=()):
+    """
+    Generate lazily all combinations of indexes of k summits (k >= 3), in
+    lexicographic order.
+    shard: an optional (i, n) to generate only the i-th of n shares of the combinations.
+    skip: combinations of indexes not to generate (e.g. already solved).
+    """
+    if k < 3:
+        raise RuntimeError("A selection requires at least 3 summits.")
+    combinations = itertools.combinations(range(len(summits)), k)
+    if shard is not None:
+        i, n = shard
+        if not (0 <= i < n):
+            raise RuntimeError("Shard i of n requires 0 <= i < n.")
+        combinations = itertools.islice(combinations, i, None, n)
+    skip = set(tuple(c) for c in skip)
+    for comb in combinations:
+        if comb not in skip:
+            yield list(comb)
+
+
+def count_selections_of_summits(summits, k=5, shard=None, skip=()):
+    """
+    Return the number of combinations generated by selections_of_summits
+    (with the same arguments), without generating them.
+    """
+    if k < 3:
+        raise RuntimeError("A selection requires at least 3 summits.")
+    n = len(summits)
+    i, shares = shard if shard is not None else (0, 1)
+    if not (0 <= i < shares):
+        raise RuntimeError("Shard i of n requires 0 <= i < n.")
+    count = len(range(i, comb(n, k), shares))
+    for c in set(tuple(c) for c in skip):
+        # Only the combinations of the shard that would be generated are skipped.
+        if len(c) == k and list(c) == sorted(set(c)) and 0 <= c[0] and c[-1] < n \
+                and _combination_rank(c, n) % shares == i:
+            count -= 1
+    return count
+
+
+def _combination_rank(combination, n):
+    """Return the rank of a sorted combination of indexes in range(n), in lexicographic order."""
+    k = len(combination)
+    rank, previous = 0, -1
+    for j, c in enumerate(combination):
+        # The combinations with a smaller index at position j come first.
+        rank += sum(comb(n - v - 1, k - j - 1) for v in range(previous + 1, c))
+        previous = c
+    return rank
 
 
 def selections_of_five_summits(summits):
     """
     Return all combination of indexes of 5 summits.
     """
-    out = []
-    ll = len(summits)
-    for i in range(0, ll - 4):
-        for j in range(i + 1, ll - 3):
-            for k in range(j + 1, ll - 2):
-                for l in range(k + 1, ll - 1):
-                    for m in range(l + 1, ll):
-                        out.append([i, j, k, l, m])
-    return out
+    return list(selections_of_summits(summits, 5))
 
 
 def change_coordinate_funs(utm_coord, local_coord):